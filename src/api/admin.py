@@ -1,14 +1,32 @@
 """Admin API routes"""
-from fastapi import APIRouter, Depends, HTTPException, Header
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime, timezone
+import asyncio
+import hmac
+import orjson
 import secrets
+import traceback
 from ..core.auth import AuthManager
+from ..core.config import config
 from ..core.database import Database
+from ..core.ttl_cache import TTLCache
+from ..core.time_utils import parse_at_expires
 from ..services.token_manager import TokenManager
 from ..services.proxy_manager import ProxyManager
 from ..services.session_manager import get_session_manager
+from ..services.browser_captcha_personal import validate_browser_proxy_url
+from ..services.browser_pool import new_context, spawn_token_task, wait_for_cookies, save_storage_state
+
+try:
+    from playwright_stealth.stealth import stealth_async
+except ImportError:
+    try:
+        from playwright_stealth import stealth_async
+    except ImportError:
+        stealth_async = None
 
 router = APIRouter()
 
@@ -17,16 +35,86 @@ token_manager: TokenManager = None
 proxy_manager: ProxyManager = None
 db: Database = None
 
-# Store active admin session tokens (in production, use Redis or database)
-active_admin_tokens = set()
+# Plugin connection URL (server host/port fixed for process lifetime, computed in set_dependencies)
+plugin_connection_url: str = ""
+
+# Max concurrent ST->AT conversions during batch import
+IMPORT_CONCURRENCY = 10
+
+# /api/tokens payload cache, keyed by TokenManager.tokens_gen
+tokens_cache = TTLCache(ttl=2)
+
+# Authorization header / session token prefixes
+BEARER_PREFIX = "Bearer "
+BEARER_PREFIX_LEN = len(BEARER_PREFIX)
+SESSION_TOKEN_PREFIX = "admin-"
+
+# Max concurrent credit refreshes during batch refresh
+BATCH_REFRESH_CONCURRENCY = 10
+
+# Admin session lifetime in seconds (sliding, refreshed on every request)
+SESSION_TTL_SECONDS = 24 * 3600
 
 
 def set_dependencies(tm: TokenManager, pm: ProxyManager, database: Database):
     """Set service instances"""
-    global token_manager, proxy_manager, db
+    global token_manager, proxy_manager, db, plugin_connection_url
     token_manager = tm
     proxy_manager = pm
     db = database
+    plugin_connection_url = _build_plugin_connection_url()
+
+
+def _build_plugin_connection_url() -> str:
+    """Build the URL the Chrome extension posts ST updates to"""
+    server_host = "127.0.0.1" if config.server_host == "0.0.0.0" else config.server_host
+    return f"http://{server_host}:{config.server_port}/api/plugin/update-token"
+
+
+# ========== Debounced Config Reload ==========
+
+# Delay used to coalesce bursts of config updates into one reload
+CONFIG_RELOAD_DEBOUNCE_SECONDS = 0.05
+
+_reload_event: Optional[asyncio.Event] = None
+_reload_task: Optional[asyncio.Task] = None
+
+
+async def _reload_worker():
+    """Background worker: reload config to memory once per burst of updates"""
+    while True:
+        await _reload_event.wait()
+        await asyncio.sleep(CONFIG_RELOAD_DEBOUNCE_SECONDS)
+        _reload_event.clear()
+        try:
+            await db.reload_config_to_memory()
+        except Exception as e:
+            print(f"❌ Config reload error: {e}")
+
+
+def schedule_config_reload():
+    """Request a hot reload without blocking the request (worker started lazily)"""
+    global _reload_event, _reload_task
+    if _reload_task is None or _reload_task.done():
+        _reload_event = asyncio.Event()
+        _reload_task = asyncio.create_task(_reload_worker())
+    _reload_event.set()
+
+
+async def stop_config_reload_worker():
+    """Flush a pending reload and stop the worker (called on shutdown)"""
+    global _reload_task
+    if _reload_task is None:
+        return
+    pending = _reload_event.is_set()
+    _reload_task.cancel()
+    try:
+        await _reload_task
+    except asyncio.CancelledError:
+        pass
+    _reload_task = None
+    if pending:
+        await db.reload_config_to_memory()
 
 
 # ========== Request Models ==========
@@ -86,6 +174,44 @@ class UpdateAdminConfigRequest(BaseModel):
     error_ban_threshold: int
 
 
+class CacheEnabledRequest(BaseModel):
+    enabled: bool = False
+
+
+class CacheConfigRequest(BaseModel):
+    enabled: Optional[bool] = None
+    timeout: Optional[int] = None
+    base_url: Optional[str] = None
+
+
+class CacheBaseUrlRequest(BaseModel):
+    base_url: str = ""
+
+
+class CaptchaConfigRequest(BaseModel):
+    captcha_method: Optional[str] = None
+    yescaptcha_api_key: Optional[str] = None
+    yescaptcha_base_url: Optional[str] = None
+    browser_proxy_enabled: bool = False
+    browser_proxy_url: Optional[str] = ""
+    browser_max_concurrency: Optional[int] = None
+    browser_simulate_human: Optional[bool] = None
+
+
+class PluginConfigRequest(BaseModel):
+    connection_token: Optional[str] = ""
+
+
+class PluginUpdateTokenRequest(BaseModel):
+    """插件推送ST请求"""
+    session_token: Optional[str] = None
+
+
+class BatchTokenIdsRequest(BaseModel):
+    """批量操作Token请求"""
+    ids: List[int]
+
+
 class ST2ATRequest(BaseModel):
     """ST转AT请求"""
     st: str
@@ -112,13 +238,17 @@ class ImportTokensRequest(BaseModel):
 
 async def verify_admin_token(authorization: str = Header(None)):
     """Verify admin session token (NOT API key)"""
-    if not authorization or not authorization.startswith("Bearer "):
+    if not authorization or not authorization.startswith(BEARER_PREFIX):
         raise HTTPException(status_code=401, detail="Missing authorization")
 
-    token = authorization[7:]
+    token = authorization[BEARER_PREFIX_LEN:]
+
+    # Reject malformed tokens without touching the database
+    if not token.startswith(SESSION_TOKEN_PREFIX):
+        raise HTTPException(status_code=401, detail="Invalid or expired admin token")
 
-    # Check if token is in active session tokens
-    if token not in active_admin_tokens:
+    # Check session in database and slide its expiry
+    if not await db.touch_admin_session(token, SESSION_TTL_SECONDS):
         raise HTTPException(status_code=401, detail="Invalid or expired admin token")
 
     return token
@@ -135,10 +265,10 @@ async def admin_login(request: LoginRequest):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     # Generate independent session token
-    session_token = f"admin-{secrets.token_urlsafe(32)}"
+    session_token = SESSION_TOKEN_PREFIX + secrets.token_urlsafe(32)
 
-    # Store in active tokens
-    active_admin_tokens.add(session_token)
+    # Store session with TTL
+    await db.add_admin_session(session_token, admin_config.username, SESSION_TTL_SECONDS)
 
     return {
         "success": True,
@@ -150,7 +280,7 @@ async def admin_login(request: LoginRequest):
 @router.post("/api/admin/logout")
 async def admin_logout(token: str = Depends(verify_admin_token)):
     """Admin logout - invalidate session token"""
-    active_admin_tokens.discard(token)
+    await db.delete_admin_session(token)
     return {"success": True, "message": "退出登录成功"}
 
 
@@ -173,38 +303,52 @@ async def change_password(
 
     await db.update_admin_config(**update_params)
 
-    # 🔥 Hot reload: sync database config to memory
+    # 🔥 Hot reload: sync database config to memory (immediate, auth depends on it)
     await db.reload_config_to_memory()
 
     # 🔑 Invalidate all admin session tokens (force re-login for security)
-    active_admin_tokens.clear()
+    await db.delete_all_admin_sessions()
 
     return {"success": True, "message": "密码修改成功,请重新登录"}
 
 
 # ========== Token Management ==========
 
-@router.get("/api/tokens")
+@router.get("/api/tokens", response_class=ORJSONResponse)
 async def get_tokens(token: str = Depends(verify_admin_token)):
     """Get all tokens with statistics"""
+    cache_key = token_manager.tokens_gen
+    cached = tokens_cache.get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
+
     tokens = await token_manager.get_all_tokens()
+    token_ids = [t.id for t in tokens]
+
+    # Stats query and session file checks are independent, run them concurrently
+    session_mgr = get_session_manager()
+    stats_map, session_map = await asyncio.gather(
+        db.get_token_stats_bulk(token_ids),
+        session_mgr.list_all_sessions_async(token_ids)
+    )
     result = []
 
     for t in tokens:
-        stats = await db.get_token_stats(t.id)
+        stats = stats_map.get(t.id)
+        session_status = session_map[t.id]
 
         result.append({
             "id": t.id,
             "st": t.st,  # Session Token for editing
             "at": t.at,  # Access Token for editing (从ST转换而来)
-            "at_expires": t.at_expires.isoformat() if t.at_expires else None,  # 🆕 AT过期时间
+            "at_expires": t.at_expires,  # 🆕 AT过期时间
             "token": t.at,  # 兼容前端 token.token 的访问方式
             "email": t.email,
             "name": t.name,
             "remark": t.remark,
             "is_active": t.is_active,
-            "created_at": t.created_at.isoformat() if t.created_at else None,
-            "last_used_at": t.last_used_at.isoformat() if t.last_used_at else None,
+            "created_at": t.created_at,
+            "last_used_at": t.last_used_at,
             "use_count": t.use_count,
             "credits": t.credits,  # 🆕 余额
             "user_paygate_tier": t.user_paygate_tier,
@@ -216,21 +360,17 @@ async def get_tokens(token: str = Depends(verify_admin_token)):
             "video_concurrency": t.video_concurrency,
             "image_count": stats.image_count if stats else 0,
             "video_count": stats.video_count if stats else 0,
-            "error_count": stats.error_count if stats else 0
+            "error_count": stats.error_count if stats else 0,
+            "browser_session": {
+                "has_session": session_status["has_session"],
+                "needs_login": session_status["needs_login"],
+                "message": session_status["message"]
+            }
         })
 
-    # Add browser session status
-    session_mgr = get_session_manager()
-    for item in result:
-        token_id = item["id"]
-        session_status = session_mgr.get_session_status(token_id)
-        item["browser_session"] = {
-            "has_session": session_status["has_session"],
-            "needs_login": session_status["needs_login"],
-            "message": session_status["message"]
-        }
-
-    return result  # 直接返回数组,兼容前端
+    tokens_cache.clear()
+    tokens_cache.set(cache_key, result)
+    return ORJSONResponse(result)  # 直接返回数组,兼容前端 (datetime由orjson原生序列化)
 
 
 @router.post("/api/tokens")
@@ -282,13 +422,7 @@ async def update_token(
         expires = result.get("expires")
 
         # 解析过期时间
-        from datetime import datetime
-        at_expires = None
-        if expires:
-            try:
-                at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-            except:
-                pass
+        at_expires = parse_at_expires(expires)
 
         # 更新token (包含AT、ST、AT过期时间、project_id和project_name)
         await token_manager.update_token(
@@ -310,6 +444,77 @@ async def update_token(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ========== Batch Token Operations ==========
+# 注意: 必须注册在 /api/tokens/{token_id}/... 路由之前, 否则 "batch" 会被当作 token_id 匹配
+
+@router.post("/api/tokens/batch/enable")
+async def batch_enable_tokens(
+    request: BatchTokenIdsRequest,
+    token: str = Depends(verify_admin_token)
+):
+    """批量启用Token"""
+    await token_manager.enable_tokens(request.ids)
+    return {"success": True, "message": f"已启用 {len(request.ids)} 个Token", "count": len(request.ids)}
+
+
+@router.post("/api/tokens/batch/disable")
+async def batch_disable_tokens(
+    request: BatchTokenIdsRequest,
+    token: str = Depends(verify_admin_token)
+):
+    """批量禁用Token"""
+    await token_manager.disable_tokens(request.ids)
+    return {"success": True, "message": f"已禁用 {len(request.ids)} 个Token", "count": len(request.ids)}
+
+
+@router.post("/api/tokens/batch/delete")
+async def batch_delete_tokens(
+    request: BatchTokenIdsRequest,
+    token: str = Depends(verify_admin_token)
+):
+    """批量删除Token"""
+    try:
+        await token_manager.delete_tokens(request.ids)
+        # 同时清理这些账号保存的浏览器登录状态
+        await get_session_manager().delete_sessions(request.ids)
+        return {"success": True, "message": f"已删除 {len(request.ids)} 个Token", "count": len(request.ids)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/tokens/batch/refresh-credits")
+async def batch_refresh_credits(
+    request: BatchTokenIdsRequest,
+    token: str = Depends(verify_admin_token)
+):
+    """批量刷新Token余额 (远程查询无法合并, 采用有限并发)"""
+    sem = asyncio.Semaphore(BATCH_REFRESH_CONCURRENCY)
+
+    async def _refresh_one(token_id: int):
+        async with sem:
+            return await token_manager.refresh_credits(token_id)
+
+    results = await asyncio.gather(
+        *[_refresh_one(token_id) for token_id in request.ids],
+        return_exceptions=True
+    )
+
+    credits = {}
+    errors = []
+    for token_id, outcome in zip(request.ids, results):
+        if isinstance(outcome, BaseException):
+            errors.append(f"Token {token_id}: {str(outcome)}")
+        else:
+            credits[token_id] = outcome
+
+    return {
+        "success": True,
+        "message": "余额刷新完成" + (f", {len(errors)} 个失败" if errors else ""),
+        "credits": credits,
+        "errors": errors if errors else None
+    }
+
+
 @router.delete("/api/tokens/{token_id}")
 async def delete_token(
     token_id: int,
@@ -318,6 +523,8 @@ async def delete_token(
     """Delete token"""
     try:
         await token_manager.delete_token(token_id)
+        # 同时清理该账号保存的浏览器登录状态
+        await get_session_manager().delete_session_async(token_id)
         return {"success": True, "message": "Token删除成功"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -413,64 +620,58 @@ async def import_tokens(
     token: str = Depends(verify_admin_token)
 ):
     """批量导入Token"""
-    from datetime import datetime, timezone
+    # 使用邮箱检查是否已存在 (只查询一次)
+    existing_tokens = await token_manager.get_all_tokens()
+    existing_by_email = {t.email: t for t in existing_tokens if t.email}
+    email_locks = {}
+    flow = token_manager.flow_client
 
-    added = 0
-    updated = 0
-    errors = []
+    sem = asyncio.Semaphore(IMPORT_CONCURRENCY)
 
-    for idx, item in enumerate(request.tokens):
-        try:
+    async def _process_one(idx: int, item: ImportTokenItem):
+        """处理单个导入项, 返回 ("added"|"updated"|"error", payload)"""
+        async with sem:
             st = item.session_token
 
             if not st:
-                errors.append(f"第{idx+1}项: 缺少 session_token")
-                continue
+                return "error", f"第{idx+1}项: 缺少 session_token"
 
-            # 使用 ST 转 AT 获取用户信息
             try:
-                result = await token_manager.flow_client.st_to_at(st)
+                # 使用 ST 转 AT 获取用户信息
+                result = await flow.st_to_at(st)
                 at = result["access_token"]
                 email = result.get("user", {}).get("email")
                 expires = result.get("expires")
 
                 if not email:
-                    errors.append(f"第{idx+1}项: 无法获取邮箱信息")
-                    continue
+                    return "error", f"第{idx+1}项: 无法获取邮箱信息"
 
                 # 解析过期时间
-                at_expires = None
-                is_expired = False
-                if expires:
-                    try:
-                        at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                        # 判断是否过期
-                        now = datetime.now(timezone.utc)
-                        is_expired = at_expires <= now
-                    except:
-                        pass
-
-                # 使用邮箱检查是否已存在
-                existing_tokens = await token_manager.get_all_tokens()
-                existing = next((t for t in existing_tokens if t.email == email), None)
-
-                if existing:
-                    # 更新现有Token
-                    await token_manager.update_token(
-                        token_id=existing.id,
-                        st=st,
-                        at=at,
-                        at_expires=at_expires,
-                        image_enabled=item.image_enabled,
-                        video_enabled=item.video_enabled,
-                        image_concurrency=item.image_concurrency,
-                        video_concurrency=item.video_concurrency
-                    )
-                    # 如果过期则禁用
-                    if is_expired:
-                        await token_manager.disable_token(existing.id)
-                    updated += 1
-                else:
+                at_expires = parse_at_expires(expires)
+                # 判断是否过期
+                is_expired = at_expires is not None and at_expires <= datetime.now(timezone.utc)
+
+                # 同一邮箱串行处理, 保证批次内重复项也能识别为已存在
+                async with email_locks.setdefault(email, asyncio.Lock()):
+                    existing = existing_by_email.get(email)
+
+                    if existing:
+                        # 更新现有Token
+                        await token_manager.update_token(
+                            token_id=existing.id,
+                            st=st,
+                            at=at,
+                            at_expires=at_expires,
+                            image_enabled=item.image_enabled,
+                            video_enabled=item.video_enabled,
+                            image_concurrency=item.image_concurrency,
+                            video_concurrency=item.video_concurrency
+                        )
+                        # 如果过期则禁用
+                        if is_expired:
+                            await token_manager.disable_token(existing.id)
+                        return "updated", existing.id
+
                     # 添加新Token
                     new_token = await token_manager.add_token(
                         st=st,
@@ -482,13 +683,32 @@ async def import_tokens(
                     # 如果过期则禁用
                     if is_expired:
                         await token_manager.disable_token(new_token.id)
-                    added += 1
+                    existing_by_email[email] = new_token
+                    return "added", new_token.id
 
             except Exception as e:
-                errors.append(f"第{idx+1}项: {str(e)}")
+                return "error", f"第{idx+1}项: {str(e)}"
 
-        except Exception as e:
-            errors.append(f"第{idx+1}项: {str(e)}")
+    results = await asyncio.gather(
+        *[_process_one(idx, item) for idx, item in enumerate(request.tokens)],
+        return_exceptions=True
+    )
+
+    added = 0
+    updated = 0
+    errors = []
+
+    for idx, outcome in enumerate(results):
+        if isinstance(outcome, BaseException):
+            errors.append(f"第{idx+1}项: {str(outcome)}")
+            continue
+        status, payload = outcome
+        if status == "added":
+            added += 1
+        elif status == "updated":
+            updated += 1
+        else:
+            errors.append(payload)
 
     return {
         "success": True,
@@ -565,8 +785,8 @@ async def update_generation_config(
     """Update generation timeout configuration"""
     await db.update_generation_config(request.image_timeout, request.video_timeout)
 
-    # 🔥 Hot reload: sync database config to memory
-    await db.reload_config_to_memory()
+    # 🔥 Hot reload: sync database config to memory (debounced)
+    schedule_config_reload()
 
     return {"success": True, "message": "生成配置更新成功"}
 
@@ -576,17 +796,12 @@ async def update_generation_config(
 @router.get("/api/system/info")
 async def get_system_info(token: str = Depends(verify_admin_token)):
     """Get system information"""
-    tokens = await token_manager.get_all_tokens()
-    active_tokens = [t for t in tokens if t.is_active]
-
-    total_credits = sum(t.credits for t in active_tokens)
+    summary = await db.get_system_summary()
 
     return {
         "success": True,
         "info": {
-            "total_tokens": len(tokens),
-            "active_tokens": len(active_tokens),
-            "total_credits": total_credits,
+            **summary,
             "version": "1.0.0"
         }
     }
@@ -606,67 +821,62 @@ async def logout(token: str = Depends(verify_admin_token)):
     return await admin_logout(token)
 
 
-@router.get("/api/stats")
+@router.get("/api/stats", response_class=ORJSONResponse)
 async def get_stats(token: str = Depends(verify_admin_token)):
     """Get statistics for dashboard"""
-    tokens = await token_manager.get_all_tokens()
-    active_tokens = [t for t in tokens if t.is_active]
-
-    # Calculate totals
-    total_images = 0
-    total_videos = 0
-    total_errors = 0
-    today_images = 0
-    today_videos = 0
-    today_errors = 0
-
-    for t in tokens:
-        stats = await db.get_token_stats(t.id)
-        if stats:
-            total_images += stats.image_count
-            total_videos += stats.video_count
-            total_errors += stats.error_count  # Historical total errors
-            today_images += stats.today_image_count
-            today_videos += stats.today_video_count
-            today_errors += stats.today_error_count
+    summary, totals = await asyncio.gather(
+        db.get_system_summary(),
+        db.get_dashboard_totals()
+    )
 
-    return {
-        "total_tokens": len(tokens),
-        "active_tokens": len(active_tokens),
-        "total_images": total_images,
-        "total_videos": total_videos,
-        "total_errors": total_errors,
-        "today_images": today_images,
-        "today_videos": today_videos,
-        "today_errors": today_errors
-    }
+    return ORJSONResponse({
+        "total_tokens": summary["total_tokens"],
+        "active_tokens": summary["active_tokens"],
+        **totals
+    })
 
 
 @router.get("/api/logs")
 async def get_logs(
     limit: int = 100,
+    fmt: str = Query("json", alias="format"),
     token: str = Depends(verify_admin_token)
 ):
-    """Get request logs with token email"""
-    logs = await db.get_logs(limit=limit)
+    """Get request logs with token email
+
+    Rows are streamed page by page from the database:
+    format=json (default) emits a JSON array, format=ndjson emits one object per line.
+    A failure mid-stream is reported as a final {"error": ...} element so the output stays well-formed.
+    """
+    async def iter_encoded():
+        try:
+            async for log in db.iter_logs(limit=limit):
+                yield orjson.dumps(log)
+        except Exception as e:
+            print(f"❌ Log stream error: {e}")
+            yield orjson.dumps({"error": str(e)})
+
+    if fmt == "ndjson":
+        async def ndjson_lines():
+            async for chunk in iter_encoded():
+                yield chunk + b"\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
-    return [{
-        "id": log.get("id"),
-        "token_id": log.get("token_id"),
-        "token_email": log.get("token_email"),
-        "token_username": log.get("token_username"),
-        "operation": log.get("operation"),
-        "status_code": log.get("status_code"),
-        "duration": log.get("duration"),
-        "created_at": log.get("created_at")
-    } for log in logs]
+    async def json_array():
+        yield b"["
+        first = True
+        async for chunk in iter_encoded():
+            yield chunk if first else b"," + chunk
+            first = False
+        yield b"]"
+
+    return StreamingResponse(json_array(), media_type="application/json")  # 兼容前端数组格式
 
 
 @router.get("/api/admin/config")
 async def get_admin_config(token: str = Depends(verify_admin_token)):
     """Get admin configuration"""
-    from ..core.config import config
-
     admin_config = await db.get_admin_config()
 
     return {
@@ -707,7 +917,7 @@ async def update_api_key(
     # Update API key in database
     await db.update_admin_config(api_key=request.new_api_key)
 
-    # 🔥 Hot reload: sync database config to memory
+    # 🔥 Hot reload: sync database config to memory (immediate, auth depends on it)
     await db.reload_config_to_memory()
 
     return {"success": True, "message": "API Key更新成功"}
@@ -723,8 +933,8 @@ async def update_debug_config(
         # Update debug config in database
         await db.update_debug_config(enabled=request.enabled)
 
-        # 🔥 Hot reload: sync database config to memory
-        await db.reload_config_to_memory()
+        # 🔥 Hot reload: sync database config to memory (debounced)
+        schedule_config_reload()
 
         status = "enabled" if request.enabled else "disabled"
         return {"success": True, "message": f"Debug mode {status}", "enabled": request.enabled}
@@ -746,8 +956,8 @@ async def update_generation_timeout(
     """Update generation timeout configuration"""
     await db.update_generation_config(request.image_timeout, request.video_timeout)
 
-    # 🔥 Hot reload: sync database config to memory
-    await db.reload_config_to_memory()
+    # 🔥 Hot reload: sync database config to memory (debounced)
+    schedule_config_reload()
 
     return {"success": True, "message": "生成配置更新成功"}
 
@@ -799,65 +1009,63 @@ async def get_cache_config(token: str = Depends(verify_admin_token)):
 
 @router.post("/api/cache/enabled")
 async def update_cache_enabled(
-    request: dict,
+    request: CacheEnabledRequest,
     token: str = Depends(verify_admin_token)
 ):
     """Update cache enabled status"""
-    enabled = request.get("enabled", False)
+    enabled = request.enabled
     await db.update_cache_config(enabled=enabled)
 
-    # 🔥 Hot reload: sync database config to memory
-    await db.reload_config_to_memory()
+    # 🔥 Hot reload: sync database config to memory (debounced)
+    schedule_config_reload()
 
     return {"success": True, "message": f"缓存已{'启用' if enabled else '禁用'}"}
 
 
 @router.post("/api/cache/config")
 async def update_cache_config_full(
-    request: dict,
+    request: CacheConfigRequest,
     token: str = Depends(verify_admin_token)
 ):
     """Update complete cache configuration"""
-    enabled = request.get("enabled")
-    timeout = request.get("timeout")
-    base_url = request.get("base_url")
+    enabled = request.enabled
+    timeout = request.timeout
+    base_url = request.base_url
 
     await db.update_cache_config(enabled=enabled, timeout=timeout, base_url=base_url)
 
-    # 🔥 Hot reload: sync database config to memory
-    await db.reload_config_to_memory()
+    # 🔥 Hot reload: sync database config to memory (debounced)
+    schedule_config_reload()
 
     return {"success": True, "message": "缓存配置更新成功"}
 
 
 @router.post("/api/cache/base-url")
 async def update_cache_base_url(
-    request: dict,
+    request: CacheBaseUrlRequest,
     token: str = Depends(verify_admin_token)
 ):
     """Update cache base URL"""
-    base_url = request.get("base_url", "")
+    base_url = request.base_url
     await db.update_cache_config(base_url=base_url)
 
-    # 🔥 Hot reload: sync database config to memory
-    await db.reload_config_to_memory()
+    # 🔥 Hot reload: sync database config to memory (debounced)
+    schedule_config_reload()
 
     return {"success": True, "message": "缓存Base URL更新成功"}
 
 
 @router.post("/api/captcha/config")
 async def update_captcha_config(
-    request: dict,
+    request: CaptchaConfigRequest,
     token: str = Depends(verify_admin_token)
 ):
     """Update captcha configuration"""
-    from ..services.browser_captcha_personal import validate_browser_proxy_url
-
-    captcha_method = request.get("captcha_method")
-    yescaptcha_api_key = request.get("yescaptcha_api_key")
-    yescaptcha_base_url = request.get("yescaptcha_base_url")
-    browser_proxy_enabled = request.get("browser_proxy_enabled", False)
-    browser_proxy_url = request.get("browser_proxy_url", "")
+    captcha_method = request.captcha_method
+    yescaptcha_api_key = request.yescaptcha_api_key
+    yescaptcha_base_url = request.yescaptcha_base_url
+    browser_proxy_enabled = request.browser_proxy_enabled
+    browser_proxy_url = request.browser_proxy_url or ""
 
     # 验证浏览器代理URL格式
     if browser_proxy_enabled and browser_proxy_url:
@@ -865,16 +1073,21 @@ async def update_captcha_config(
         if not is_valid:
             return {"success": False, "message": error_msg}
 
+    if request.browser_max_concurrency is not None and request.browser_max_concurrency < 1:
+        return {"success": False, "message": "浏览器打码并发数必须大于等于1"}
+
     await db.update_captcha_config(
         captcha_method=captcha_method,
         yescaptcha_api_key=yescaptcha_api_key,
         yescaptcha_base_url=yescaptcha_base_url,
         browser_proxy_enabled=browser_proxy_enabled,
-        browser_proxy_url=browser_proxy_url if browser_proxy_enabled else None
+        browser_proxy_url=browser_proxy_url if browser_proxy_enabled else None,
+        browser_max_concurrency=request.browser_max_concurrency,
+        browser_simulate_human=request.browser_simulate_human
     )
 
-    # 🔥 Hot reload: sync database config to memory
-    await db.reload_config_to_memory()
+    # 🔥 Hot reload: sync database config to memory (debounced)
+    schedule_config_reload()
 
     return {"success": True, "message": "验证码配置更新成功"}
 
@@ -888,7 +1101,9 @@ async def get_captcha_config(token: str = Depends(verify_admin_token)):
         "yescaptcha_api_key": captcha_config.yescaptcha_api_key,
         "yescaptcha_base_url": captcha_config.yescaptcha_base_url,
         "browser_proxy_enabled": captcha_config.browser_proxy_enabled,
-        "browser_proxy_url": captcha_config.browser_proxy_url or ""
+        "browser_proxy_url": captcha_config.browser_proxy_url or "",
+        "browser_max_concurrency": captcha_config.browser_max_concurrency,
+        "browser_simulate_human": captcha_config.browser_simulate_human
     }
 
 
@@ -899,33 +1114,22 @@ async def get_plugin_config(token: str = Depends(verify_admin_token)):
     """Get plugin configuration"""
     plugin_config = await db.get_plugin_config()
 
-    # Get server host and port from config
-    from ..core.config import config
-    server_host = config.server_host
-    server_port = config.server_port
-
-    # Generate connection URL
-    if server_host == "0.0.0.0":
-        connection_url = f"http://127.0.0.1:{server_port}/api/plugin/update-token"
-    else:
-        connection_url = f"http://{server_host}:{server_port}/api/plugin/update-token"
-
     return {
         "success": True,
         "config": {
             "connection_token": plugin_config.connection_token,
-            "connection_url": connection_url
+            "connection_url": plugin_connection_url
         }
     }
 
 
 @router.post("/api/plugin/config")
 async def update_plugin_config(
-    request: dict,
+    request: PluginConfigRequest,
     token: str = Depends(verify_admin_token)
 ):
     """Update plugin configuration"""
-    connection_token = request.get("connection_token", "")
+    connection_token = request.connection_token
 
     # Generate random token if empty
     if not connection_token:
@@ -941,7 +1145,7 @@ async def update_plugin_config(
 
 
 @router.post("/api/plugin/update-token")
-async def plugin_update_token(request: dict, authorization: Optional[str] = Header(None)):
+async def plugin_update_token(request: PluginUpdateTokenRequest, authorization: Optional[str] = Header(None)):
     """Receive token update from Chrome extension (no admin auth required, uses connection_token)"""
     # Verify connection token
     plugin_config = await db.get_plugin_config()
@@ -949,17 +1153,20 @@ async def plugin_update_token(request: dict, authorization: Optional[str] = Head
     # Extract token from Authorization header
     provided_token = None
     if authorization:
-        if authorization.startswith("Bearer "):
-            provided_token = authorization[7:]
+        if authorization.startswith(BEARER_PREFIX):
+            provided_token = authorization[BEARER_PREFIX_LEN:]
         else:
             provided_token = authorization
 
     # Check if token matches
-    if not plugin_config.connection_token or provided_token != plugin_config.connection_token:
+    # Constant-time comparison to avoid leaking the token via timing
+    if not plugin_config.connection_token or not provided_token or not hmac.compare_digest(
+        provided_token.encode(), plugin_config.connection_token.encode()
+    ):
         raise HTTPException(status_code=401, detail="Invalid connection token")
 
     # Extract session token from request
-    session_token = request.get("session_token")
+    session_token = request.session_token
 
     if not session_token:
         raise HTTPException(status_code=400, detail="Missing session_token")
@@ -976,13 +1183,7 @@ async def plugin_update_token(request: dict, authorization: Optional[str] = Head
             raise HTTPException(status_code=400, detail="Failed to get email from session token")
 
         # Parse expiration time
-        from datetime import datetime
-        at_expires = None
-        if expires:
-            try:
-                at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-            except:
-                pass
+        at_expires = parse_at_expires(expires)
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid session token: {str(e)}")
@@ -1035,7 +1236,7 @@ async def get_token_session_status(
 ):
     """获取Token的浏览器Session状态"""
     session_mgr = get_session_manager()
-    status = session_mgr.get_session_status(token_id)
+    status = await asyncio.to_thread(session_mgr.get_session_status, token_id)
     return {
         "success": True,
         "token_id": token_id,
@@ -1048,13 +1249,10 @@ async def trigger_browser_login(
     token_id: int,
     token: str = Depends(verify_admin_token)
 ):
-    """拉起可见浏览器让用户登录并保存Session（后台线程）"""
-    import threading
-    import os
-    import time
+    """拉起可见浏览器让用户登录并保存Session（后台任务）"""
     
     # Get the token to find project_id
-    target_token = await token_manager.get_token(token_id)
+    target_token = await token_manager.get_token_cached(token_id)
     if not target_token:
         raise HTTPException(status_code=404, detail="Token不存在")
     
@@ -1066,14 +1264,14 @@ async def trigger_browser_login(
     session_mgr = get_session_manager()
     auth_path = session_mgr.get_session_path(token_id)
     
-    # Define the background browser login function
-    def run_browser_login_sync():
-        import asyncio
-        asyncio.run(_browser_login_task(token_id, auth_path, session_mgr.SESSION_DIR))
-    
-    # Start background thread
-    thread = threading.Thread(target=run_browser_login_sync, daemon=True)
-    thread.start()
+    # Run on the main event loop (the shared Playwright browser is bound to it)
+    task = spawn_token_task(
+        token_id,
+        _browser_login_task(token_id, auth_path),
+        name=f"browser-login-{token_id}"
+    )
+    if task is None:
+        raise HTTPException(status_code=409, detail="该Token已有浏览器任务在运行，请稍后再试")
     
     return {
         "success": True,
@@ -1082,47 +1280,30 @@ async def trigger_browser_login(
     }
 
 
-async def _browser_login_task(token_id: int, auth_path: str, session_dir: str):
+async def _browser_login_task(token_id: int, auth_path: str):
     """后台执行的浏览器登录任务"""
-    from playwright.async_api import async_playwright
-    import os
-    
+    session_mgr = get_session_manager()
+    context = None
     try:
-        print(f"[BrowserLogin] 正在启动浏览器用于 Token {token_id}...")
-        
-        # Create a NEW visible browser instance
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(
-            headless=False,  # 显示浏览器窗口
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-            ]
-        )
+        print(f"[BrowserLogin] 正在打开浏览器用于 Token {token_id}...")
         
         # Check if existing session exists
-        load_state = auth_path if os.path.exists(auth_path) else None
+        load_state = auth_path if session_mgr.has_session(token_id) else None
         
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            storage_state=load_state
-        )
-        
-        page = await context.new_page()
+        # Shared visible browser, each task gets its own isolated context
+        context = await new_context(storage_state=load_state)
         
-        # Apply stealth with fallback
-        try:
-            from playwright_stealth.stealth import stealth_async
-            await stealth_async(page)
-            print("[BrowserLogin] Stealth 模式已启用")
-        except ImportError:
+        # Apply stealth if available (as context init scripts, so every page gets it)
+        if stealth_async:
             try:
-                from playwright_stealth import stealth_async
-                await stealth_async(page)
-                print("[BrowserLogin] Stealth 模式已启用 (direct import)")
-            except:
-                print("[BrowserLogin] 无法加载 playwright-stealth，继续执行...")
+                await stealth_async(context)
+                print("[BrowserLogin] Stealth 模式已启用")
+            except Exception as e:
+                print(f"[BrowserLogin] Stealth 启用失败: {e}，继续执行...")
+        else:
+            print("[BrowserLogin] 无法加载 playwright-stealth，继续执行...")
+        
+        page = await context.new_page()
         
         # Navigate to Google accounts page
         await page.goto("https://accounts.google.com")
@@ -1130,36 +1311,27 @@ async def _browser_login_task(token_id: int, auth_path: str, session_dir: str):
         print(f"[BrowserLogin] 浏览器已打开，等待用户登录 Token {token_id}...")
         print(f"[BrowserLogin] 登录成功后将保存到: {auth_path}")
         
-        # Poll for login completion (max 300 seconds = 5 minutes)
-        login_detected = False
-        for _ in range(60):
-            await page.wait_for_timeout(5000)  # Wait 5 seconds
-            
-            # Save session periodically
-            os.makedirs(session_dir, exist_ok=True)
-            await context.storage_state(path=auth_path)
-            
-            # Check for login by looking for auth cookies
-            cookies = await context.cookies()
-            has_psid = any(c['name'] == '__Secure-3PSID' for c in cookies)
-            has_sid = any(c['name'] == 'SID' for c in cookies)
-            
-            if has_psid and has_sid:
-                login_detected = True
-                print(f"[BrowserLogin] ✅ 检测到登录成功！Session已保存到 {auth_path}")
-                break
-        
-        # Close browser
-        await browser.close()
-        await playwright.stop()
+        # Wait for login completion (max 300 seconds = 5 minutes)
+        auth_cookies = await wait_for_cookies(page, ("__Secure-3PSID", "SID"), timeout=300)
+        login_detected = auth_cookies is not None
         
         if login_detected:
+            # Save session once, after login completed
+            await save_storage_state(context, auth_path)
+            session_mgr.mark_session_saved(token_id)
+            print(f"[BrowserLogin] ✅ 检测到登录成功！Session已保存到 {auth_path}")
             print(f"[BrowserLogin] ✅ Token {token_id} 登录完成")
         else:
             print(f"[BrowserLogin] ⚠️ Token {token_id} 登录超时或用户关闭了浏览器")
             
     except Exception as e:
         print(f"[BrowserLogin] ❌ Token {token_id} 登录失败: {str(e)}")
+    finally:
+        if context:
+            try:
+                await context.close()
+            except Exception:
+                pass
 
 
 @router.post("/api/tokens/{token_id}/extract-st")
@@ -1168,30 +1340,27 @@ async def extract_st_from_session(
     token: str = Depends(verify_admin_token)
 ):
     """从浏览器Session中自动提取ST并更新Token"""
-    import threading
-    import os
-    
     # Get session manager
     session_mgr = get_session_manager()
     auth_path = session_mgr.get_session_path(token_id)
     
     # Check if session exists
-    if not os.path.exists(auth_path):
+    if not session_mgr.has_session(token_id):
         raise HTTPException(status_code=400, detail=f"Token {token_id} 没有保存的浏览器Session，请先点击登录")
     
     # Get the token
-    target_token = await token_manager.get_token(token_id)
+    target_token = await token_manager.get_token_cached(token_id)
     if not target_token:
         raise HTTPException(status_code=404, detail="Token不存在")
     
-    # Define the background extraction function
-    def run_extract_st_sync():
-        import asyncio
-        asyncio.run(_extract_st_task(token_id, auth_path, target_token.current_project_id))
-    
-    # Start background thread
-    thread = threading.Thread(target=run_extract_st_sync, daemon=True)
-    thread.start()
+    # Run on the main event loop (the shared Playwright browser is bound to it)
+    task = spawn_token_task(
+        token_id,
+        _extract_st_task(token_id, auth_path, target_token.current_project_id),
+        name=f"extract-st-{token_id}"
+    )
+    if task is None:
+        raise HTTPException(status_code=409, detail="该Token已有浏览器任务在运行，请稍后再试")
     
     return {
         "success": True,
@@ -1202,28 +1371,13 @@ async def extract_st_from_session(
 
 async def _extract_st_task(token_id: int, auth_path: str, project_id: str):
     """后台执行的ST提取任务 - 自动打开浏览器获取ST并更新数据库"""
-    from playwright.async_api import async_playwright
-    import os
-    import json
-    
+    flow = token_manager.flow_client
+    context = None
     try:
         print(f"[ExtractST] 正在从Session提取 Token {token_id} 的 ST...")
         
-        # Create browser with saved session
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(
-            headless=False,  # 显示浏览器便于调试
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-            ]
-        )
-        
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            storage_state=auth_path  # Load saved session
-        )
+        # Shared browser + isolated context loaded with the saved session
+        context = await new_context(storage_state=auth_path)
         
         page = await context.new_page()
         
@@ -1231,47 +1385,31 @@ async def _extract_st_task(token_id: int, auth_path: str, project_id: str):
         print(f"[ExtractST] 打开 labs.google/fx/tools/flow...")
         await page.goto("https://labs.google/fx/tools/flow", timeout=60000)
         
-        # Wait for page to load
-        await page.wait_for_timeout(3000)
-        
-        # Click "Create with Flow" button to trigger OAuth login
+        # Click "Create with Flow" button to trigger OAuth login (wait in-page until it renders, max 3s)
         try:
             create_button = page.get_by_text("Create with Flow")
-            if await create_button.is_visible():
-                print(f"[ExtractST] 点击 'Create with Flow' 按钮...")
-                await create_button.click()
+            await create_button.wait_for(state="visible", timeout=3000)
+            print(f"[ExtractST] 点击 'Create with Flow' 按钮...")
+            await create_button.click()
         except:
             pass
         
         # Wait for OAuth to complete and session-token to appear (max 2 minutes)
         print(f"[ExtractST] 等待登录完成 (最多120秒)...")
-        st_value = None
-        for i in range(24):  # 24 * 5s = 120 seconds
-            await page.wait_for_timeout(5000)
-            
-            # Check for session token cookie
-            cookies = await context.cookies(["https://labs.google"])
-            for cookie in cookies:
-                if cookie['name'] == '__Secure-next-auth.session-token':
-                    st_value = cookie['value']
-                    print(f"[ExtractST] ✅ 找到 session-token!")
-                    break
-            
-            if st_value:
-                break
-            
-            print(f"[ExtractST] 等待中... ({(i+1)*5}/120秒)")
-            
-            # Save session periodically
-            await context.storage_state(path=auth_path)
+        st_cookies = await wait_for_cookies(
+            page, ("__Secure-next-auth.session-token",), timeout=120, urls=["https://labs.google"]
+        )
+        st_value = st_cookies["__Secure-next-auth.session-token"] if st_cookies else None
+        if st_value:
+            print(f"[ExtractST] ✅ 找到 session-token!")
         
-        # Save final session
-        await context.storage_state(path=auth_path)
-        print(f"[ExtractST] Session 已更新保存到 {auth_path}")
+        # Save final session (only rewritten when cookies / storage changed)
+        if await save_storage_state(context, auth_path):
+            print(f"[ExtractST] Session 已更新保存到 {auth_path}")
         
-        # Close browser
-        await browser.close()
-        await playwright.stop()
+        # Release the context (shared browser stays up)
+        await context.close()
+        context = None
         
         if st_value:
             print(f"[ExtractST] ✅ Token {token_id} ST 提取成功!")
@@ -1282,19 +1420,14 @@ async def _extract_st_task(token_id: int, auth_path: str, project_id: str):
                 print(f"[ExtractST] ST已更新到数据库")
                 
                 # Refresh AT using new ST
-                result = await token_manager.flow_client.st_to_at(st_value)
+                result = await flow.st_to_at(st_value)
                 new_at = result["access_token"]
                 expires = result.get("expires")
                 
-                from datetime import datetime
-                at_expires = None
-                if expires:
-                    try:
-                        at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                    except:
-                        pass
+                at_expires = parse_at_expires(expires)
                 
                 await db.update_token(token_id, at=new_at, at_expires=at_expires)
+                token_manager.mark_tokens_changed()
                 print(f"[ExtractST] ✅ AT已刷新! 新过期时间: {at_expires}")
             except Exception as e:
                 print(f"[ExtractST] ⚠️ 更新数据库失败: {e}")
@@ -1303,9 +1436,14 @@ async def _extract_st_task(token_id: int, auth_path: str, project_id: str):
             print(f"[ExtractST] 可能需要在浏览器中完成 labs.google 的 OAuth 授权")
             
     except Exception as e:
-        import traceback
         print(f"[ExtractST] ❌ Token {token_id} ST 提取失败: {str(e)}")
         traceback.print_exc()
+    finally:
+        if context:
+            try:
+                await context.close()
+            except Exception:
+                pass
 
 
 
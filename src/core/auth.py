@@ -1,5 +1,6 @@
 """Authentication module"""
 import bcrypt
+import hmac
 from typing import Optional
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -7,19 +8,30 @@ from .config import config
 
 security = HTTPBearer()
 
+
+def _safe_equals(a: Optional[str], b: Optional[str]) -> bool:
+    """Constant-time string comparison (None never matches)"""
+    if a is None or b is None:
+        return False
+    return hmac.compare_digest(a.encode(), b.encode())
+
+
 class AuthManager:
     """Authentication manager"""
 
     @staticmethod
     def verify_api_key(api_key: str) -> bool:
         """Verify API key"""
-        return api_key == config.api_key
+        return _safe_equals(api_key, config.api_key)
 
     @staticmethod
     def verify_admin(username: str, password: str) -> bool:
         """Verify admin credentials"""
         # Compare with current config (which may be from database or config file)
-        return username == config.admin_username and password == config.admin_password
+        # Evaluate both comparisons so timing does not reveal which field was wrong
+        username_ok = _safe_equals(username, config.admin_username)
+        password_ok = _safe_equals(password, config.admin_password)
+        return username_ok and password_ok
 
     @staticmethod
     def hash_password(password: str) -> str:
@@ -1,12 +1,23 @@
 """Database storage layer for Flow2API"""
 import aiosqlite
+import asyncio
 import json
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, AsyncIterator
 from pathlib import Path
+from .ttl_cache import TTLCache
 from .models import Token, TokenStats, Task, RequestLog, AdminConfig, ProxyConfig, GenerationConfig, CacheConfig, Project, CaptchaConfig, PluginConfig
 
 
+# Seconds a config row stays cached in memory (writes invalidate immediately)
+CONFIG_CACHE_TTL = 30
+
+# Max number of pooled SQLite connections
+DB_POOL_SIZE = 5
+
+
 class Database:
     """SQLite database manager"""
 
@@ -17,6 +28,45 @@ class Database:
             data_dir.mkdir(exist_ok=True)
             db_path = str(data_dir / "flow.db")
         self.db_path = db_path
+        self._config_cache = TTLCache(ttl=CONFIG_CACHE_TTL)
+        # Connection pool: idle connections are reused, the semaphore caps open connections
+        self._idle_connections: List[aiosqlite.Connection] = []
+        self._pool_semaphore = asyncio.Semaphore(DB_POOL_SIZE)
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        """Open a new SQLite connection tuned for concurrent access"""
+        conn = await aiosqlite.connect(self.db_path)
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA cache_size=-65536")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Borrow a pooled connection (drop-in for ``aiosqlite.connect(self.db_path)``)"""
+        async with self._pool_semaphore:
+            conn = self._idle_connections.pop() if self._idle_connections else await self._open_connection()
+            try:
+                yield conn
+            finally:
+                try:
+                    # Leave no open transaction / per-call row factory behind for the next borrower
+                    if conn.in_transaction:
+                        await conn.rollback()
+                    conn.row_factory = None
+                    self._idle_connections.append(conn)
+                except Exception:
+                    await conn.close()
+
+    async def close(self):
+        """Close all pooled connections"""
+        while self._idle_connections:
+            conn = self._idle_connections.pop()
+            try:
+                await conn.close()
+            except Exception:
+                pass
 
     def db_exists(self) -> bool:
         """Check if database file exists"""
@@ -190,7 +240,7 @@ class Database:
                         Used only to initialize missing config rows with default values.
                         Existing config rows will NOT be overwritten.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             print("Checking database integrity and performing migrations...")
 
             # ========== Step 1: Create missing tables ==========
@@ -221,11 +271,26 @@ class Database:
                         page_action TEXT DEFAULT 'FLOW_GENERATION',
                         browser_proxy_enabled BOOLEAN DEFAULT 0,
                         browser_proxy_url TEXT,
+                        browser_max_concurrency INTEGER DEFAULT 4,
+                        browser_simulate_human BOOLEAN DEFAULT 0,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 """)
 
+            # Check and create admin_sessions table if missing
+            if not await self._table_exists(db, "admin_sessions"):
+                print("  ✓ Creating missing table: admin_sessions")
+                await db.execute("""
+                    CREATE TABLE admin_sessions (
+                        token TEXT PRIMARY KEY,
+                        username TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_admin_sessions_expires ON admin_sessions(expires_at)")
+
             # ========== Step 2: Add missing columns to existing tables ==========
             # Check and add missing columns to tokens table
             if await self._table_exists(db, "tokens"):
@@ -266,6 +331,8 @@ class Database:
                 captcha_columns_to_add = [
                     ("browser_proxy_enabled", "BOOLEAN DEFAULT 0"),
                     ("browser_proxy_url", "TEXT"),
+                    ("browser_max_concurrency", "INTEGER DEFAULT 4"),
+                    ("browser_simulate_human", "BOOLEAN DEFAULT 0"),
                 ]
 
                 for col_name, col_type in captcha_columns_to_add:
@@ -304,7 +371,7 @@ class Database:
 
     async def init_db(self):
         """Initialize database tables"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             # Tokens table (Flow2API版本)
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS tokens (
@@ -468,6 +535,8 @@ class Database:
                     page_action TEXT DEFAULT 'FLOW_GENERATION',
                     browser_proxy_enabled BOOLEAN DEFAULT 0,
                     browser_proxy_url TEXT,
+                    browser_max_concurrency INTEGER DEFAULT 4,
+                    browser_simulate_human BOOLEAN DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
@@ -483,10 +552,21 @@ class Database:
                 )
             """)
 
+            # Admin sessions table (管理后台登录会话)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS admin_sessions (
+                    token TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
             # Create indexes
             await db.execute("CREATE INDEX IF NOT EXISTS idx_task_id ON tasks(task_id)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_token_st ON tokens(st)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_project_id ON projects(project_id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_admin_sessions_expires ON admin_sessions(expires_at)")
 
             # Migrate request_logs table if needed
             await self._migrate_request_logs(db)
@@ -550,7 +630,7 @@ class Database:
     # Token operations
     async def add_token(self, token: Token) -> int:
         """Add a new token"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 INSERT INTO tokens (st, at, at_expires, email, name, remark, is_active,
                                    credits, user_paygate_tier, current_project_id, current_project_name,
@@ -574,7 +654,7 @@ class Database:
 
     async def get_token(self, token_id: int) -> Optional[Token]:
         """Get token by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens WHERE id = ?", (token_id,))
             row = await cursor.fetchone()
@@ -584,7 +664,7 @@ class Database:
 
     async def get_token_by_st(self, st: str) -> Optional[Token]:
         """Get token by ST"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens WHERE st = ?", (st,))
             row = await cursor.fetchone()
@@ -594,7 +674,7 @@ class Database:
 
     async def get_all_tokens(self) -> List[Token]:
         """Get all tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens ORDER BY created_at DESC")
             rows = await cursor.fetchall()
@@ -602,7 +682,7 @@ class Database:
 
     async def get_active_tokens(self) -> List[Token]:
         """Get all active tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tokens WHERE is_active = 1 ORDER BY last_used_at ASC")
             rows = await cursor.fetchall()
@@ -610,7 +690,7 @@ class Database:
 
     async def update_token(self, token_id: int, **kwargs):
         """Update token fields"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             updates = []
             params = []
 
@@ -625,9 +705,81 @@ class Database:
                 await db.execute(query, params)
                 await db.commit()
 
+    async def set_tokens_active(self, token_ids: List[int], is_active: bool):
+        """Enable/disable many tokens in one statement
+
+        Enabling also resets consecutive_error_count, same as a single enable.
+        """
+        if not token_ids:
+            return
+        placeholders = ",".join("?" * len(token_ids))
+        async with self._connection() as db:
+            await db.execute(
+                f"UPDATE tokens SET is_active = ? WHERE id IN ({placeholders})",
+                [is_active, *token_ids]
+            )
+            if is_active:
+                await db.execute(
+                    f"UPDATE token_stats SET consecutive_error_count = 0 WHERE token_id IN ({placeholders})",
+                    list(token_ids)
+                )
+            await db.commit()
+
+    async def delete_tokens(self, token_ids: List[int]):
+        """Delete many tokens and their related data in one transaction"""
+        if not token_ids:
+            return
+        placeholders = ",".join("?" * len(token_ids))
+        params = list(token_ids)
+        async with self._connection() as db:
+            await db.execute(f"DELETE FROM token_stats WHERE token_id IN ({placeholders})", params)
+            await db.execute(f"DELETE FROM projects WHERE token_id IN ({placeholders})", params)
+            await db.execute(f"DELETE FROM tokens WHERE id IN ({placeholders})", params)
+            await db.commit()
+
+    async def get_system_summary(self) -> dict:
+        """Get token counts and total credits of active tokens in one aggregate query"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT
+                    COUNT(*),
+                    COALESCE(SUM(CASE WHEN is_active THEN 1 ELSE 0 END), 0),
+                    COALESCE(SUM(CASE WHEN is_active THEN credits ELSE 0 END), 0)
+                FROM tokens
+            """)
+            row = await cursor.fetchone()
+            return {
+                "total_tokens": row[0],
+                "active_tokens": row[1],
+                "total_credits": row[2]
+            }
+
+    async def get_dashboard_totals(self) -> dict:
+        """Get summed image/video/error counters (total and today) across all tokens"""
+        async with self._connection() as db:
+            cursor = await db.execute("""
+                SELECT
+                    COALESCE(SUM(image_count), 0),
+                    COALESCE(SUM(video_count), 0),
+                    COALESCE(SUM(error_count), 0),
+                    COALESCE(SUM(today_image_count), 0),
+                    COALESCE(SUM(today_video_count), 0),
+                    COALESCE(SUM(today_error_count), 0)
+                FROM token_stats
+            """)
+            row = await cursor.fetchone()
+            return {
+                "total_images": row[0],
+                "total_videos": row[1],
+                "total_errors": row[2],
+                "today_images": row[3],
+                "today_videos": row[4],
+                "today_errors": row[5]
+            }
+
     async def delete_token(self, token_id: int):
         """Delete token and related data"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("DELETE FROM token_stats WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM projects WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM tokens WHERE id = ?", (token_id,))
@@ -636,7 +788,7 @@ class Database:
     # Project operations
     async def add_project(self, project: Project) -> int:
         """Add a new project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 INSERT INTO projects (project_id, token_id, project_name, tool_name, is_active)
                 VALUES (?, ?, ?, ?, ?)
@@ -647,7 +799,7 @@ class Database:
 
     async def get_project_by_id(self, project_id: str) -> Optional[Project]:
         """Get project by UUID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM projects WHERE project_id = ?", (project_id,))
             row = await cursor.fetchone()
@@ -657,7 +809,7 @@ class Database:
 
     async def get_projects_by_token(self, token_id: int) -> List[Project]:
         """Get all projects for a token"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute(
                 "SELECT * FROM projects WHERE token_id = ? ORDER BY created_at DESC",
@@ -668,14 +820,14 @@ class Database:
 
     async def delete_project(self, project_id: str):
         """Delete project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
             await db.commit()
 
     # Task operations
     async def create_task(self, task: Task) -> int:
         """Create a new task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute("""
                 INSERT INTO tasks (task_id, token_id, model, prompt, status, progress, scene_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -686,7 +838,7 @@ class Database:
 
     async def get_task(self, task_id: str) -> Optional[Task]:
         """Get task by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
             row = await cursor.fetchone()
@@ -700,7 +852,7 @@ class Database:
 
     async def update_task(self, task_id: str, **kwargs):
         """Update task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             updates = []
             params = []
 
@@ -730,7 +882,7 @@ class Database:
 
     async def get_token_stats(self, token_id: int) -> Optional[TokenStats]:
         """Get token statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM token_stats WHERE token_id = ?", (token_id,))
             row = await cursor.fetchone()
@@ -738,10 +890,24 @@ class Database:
                 return TokenStats(**dict(row))
             return None
 
+    async def get_token_stats_bulk(self, token_ids: List[int]) -> Dict[int, TokenStats]:
+        """Get statistics for many tokens in one query, keyed by token_id"""
+        if not token_ids:
+            return {}
+        placeholders = ",".join("?" * len(token_ids))
+        async with self._connection() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute(
+                f"SELECT * FROM token_stats WHERE token_id IN ({placeholders})",
+                list(token_ids)
+            )
+            rows = await cursor.fetchall()
+            return {row["token_id"]: TokenStats(**dict(row)) for row in rows}
+
     async def increment_image_count(self, token_id: int):
         """Increment image generation count with daily reset"""
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -770,7 +936,7 @@ class Database:
     async def increment_video_count(self, token_id: int):
         """Increment video generation count with daily reset"""
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -805,7 +971,7 @@ class Database:
         - today_error_count: Today's errors (reset on date change)
         """
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -844,7 +1010,7 @@ class Database:
 
         Note: error_count (total historical errors) is NEVER reset
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("""
                 UPDATE token_stats SET consecutive_error_count = 0 WHERE token_id = ?
             """, (token_id,))
@@ -853,17 +1019,22 @@ class Database:
     # Config operations
     async def get_admin_config(self) -> Optional[AdminConfig]:
         """Get admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self._config_cache.get("admin_config")
+        if cached is not None:
+            return cached
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM admin_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
-                return AdminConfig(**dict(row))
+                result = AdminConfig(**dict(row))
+                self._config_cache.set("admin_config", result)
+                return result
             return None
 
     async def update_admin_config(self, **kwargs):
         """Update admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             updates = []
             params = []
 
@@ -878,19 +1049,79 @@ class Database:
                 await db.execute(query, params)
                 await db.commit()
 
+        # Invalidate cached row after commit
+        self._config_cache.pop("admin_config")
+
+    # Admin session operations
+    async def add_admin_session(self, token: str, username: str, ttl_seconds: int):
+        """Create an admin session that expires after ttl_seconds"""
+        async with self._connection() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO admin_sessions (token, username, expires_at)
+                VALUES (?, ?, ?)
+            """, (token, username, time.time() + ttl_seconds))
+            await db.commit()
+
+    async def touch_admin_session(self, token: str, ttl_seconds: int, slide_after: int = 300) -> bool:
+        """Slide the expiry of a live admin session, return False if missing or expired
+
+        The lookup is read-only; the expiry is only rewritten once it is more than
+        slide_after seconds stale, so dashboard polling does not write on every request.
+        """
+        now = time.time()
+        async with self._connection() as db:
+            cursor = await db.execute(
+                "SELECT expires_at FROM admin_sessions WHERE token = ? AND expires_at > ?",
+                (token, now)
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return False
+            if row[0] < now + ttl_seconds - slide_after:
+                await db.execute("""
+                    UPDATE admin_sessions SET expires_at = ?
+                    WHERE token = ? AND expires_at < ?
+                """, (now + ttl_seconds, token, now + ttl_seconds - slide_after))
+                await db.commit()
+            return True
+
+    async def delete_admin_session(self, token: str):
+        """Delete an admin session"""
+        async with self._connection() as db:
+            await db.execute("DELETE FROM admin_sessions WHERE token = ?", (token,))
+            await db.commit()
+
+    async def delete_expired_admin_sessions(self) -> int:
+        """Delete expired admin sessions, return number of rows removed"""
+        async with self._connection() as db:
+            cursor = await db.execute("DELETE FROM admin_sessions WHERE expires_at <= ?", (time.time(),))
+            await db.commit()
+            return cursor.rowcount
+
+    async def delete_all_admin_sessions(self):
+        """Delete all admin sessions (force re-login)"""
+        async with self._connection() as db:
+            await db.execute("DELETE FROM admin_sessions")
+            await db.commit()
+
     async def get_proxy_config(self) -> Optional[ProxyConfig]:
         """Get proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self._config_cache.get("proxy_config")
+        if cached is not None:
+            return cached
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM proxy_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
-                return ProxyConfig(**dict(row))
+                result = ProxyConfig(**dict(row))
+                self._config_cache.set("proxy_config", result)
+                return result
             return None
 
     async def update_proxy_config(self, enabled: bool, proxy_url: Optional[str] = None):
         """Update proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("""
                 UPDATE proxy_config
                 SET enabled = ?, proxy_url = ?, updated_at = CURRENT_TIMESTAMP
@@ -898,19 +1129,27 @@ class Database:
             """, (enabled, proxy_url))
             await db.commit()
 
+        # Invalidate cached row after commit
+        self._config_cache.pop("proxy_config")
+
     async def get_generation_config(self) -> Optional[GenerationConfig]:
         """Get generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self._config_cache.get("generation_config")
+        if cached is not None:
+            return cached
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM generation_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
-                return GenerationConfig(**dict(row))
+                result = GenerationConfig(**dict(row))
+                self._config_cache.set("generation_config", result)
+                return result
             return None
 
     async def update_generation_config(self, image_timeout: int, video_timeout: int):
         """Update generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("""
                 UPDATE generation_config
                 SET image_timeout = ?, video_timeout = ?, updated_at = CURRENT_TIMESTAMP
@@ -918,10 +1157,13 @@ class Database:
             """, (image_timeout, video_timeout))
             await db.commit()
 
+        # Invalidate cached row after commit
+        self._config_cache.pop("generation_config")
+
     # Request log operations
     async def add_request_log(self, log: RequestLog):
         """Add request log"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute("""
                 INSERT INTO request_logs (token_id, operation, request_body, response_body, status_code, duration)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -931,7 +1173,7 @@ class Database:
 
     async def get_logs(self, limit: int = 100, token_id: Optional[int] = None):
         """Get request logs with token email"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
 
             if token_id:
@@ -975,6 +1217,54 @@ class Database:
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
+    async def iter_logs(self, limit: int = 100, token_id: Optional[int] = None,
+                        page_size: int = 200) -> AsyncIterator[dict]:
+        """Iterate request log summaries (without request/response bodies), newest first
+
+        Rows are read in keyset pages; the pooled connection is released between pages
+        so a slow consumer never pins one of the pool's connections.
+        """
+        remaining = limit
+        cursor_key = None  # (created_at, id) of the last row yielded
+        while remaining > 0:
+            clauses = []
+            params: list = []
+            if token_id:
+                clauses.append("rl.token_id = ?")
+                params.append(token_id)
+            if cursor_key is not None:
+                clauses.append("(rl.created_at < ? OR (rl.created_at = ? AND rl.id < ?))")
+                params.extend((cursor_key[0], cursor_key[0], cursor_key[1]))
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            params.append(min(page_size, remaining))
+            async with self._connection() as db:
+                db.row_factory = aiosqlite.Row
+                cursor = await db.execute(f"""
+                    SELECT
+                        rl.id,
+                        rl.token_id,
+                        t.email as token_email,
+                        t.name as token_username,
+                        rl.operation,
+                        rl.status_code,
+                        rl.duration,
+                        rl.created_at
+                    FROM request_logs rl
+                    LEFT JOIN tokens t ON rl.token_id = t.id
+                    {where}
+                    ORDER BY rl.created_at DESC, rl.id DESC
+                    LIMIT ?
+                """, params)
+                rows = await cursor.fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            remaining -= len(rows)
+            if len(rows) < params[-1]:
+                return
+            cursor_key = (rows[-1]["created_at"], rows[-1]["id"])
+
     async def init_config_from_toml(self, config_dict: dict, is_first_startup: bool = True):
         """
         Initialize database configuration from setting.toml
@@ -984,7 +1274,7 @@ class Database:
             is_first_startup: If True, initialize all config rows from setting.toml.
                             If False (upgrade mode), only ensure missing config rows exist with default values.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             if is_first_startup:
                 # First startup: Initialize all config tables with values from setting.toml
                 await self._ensure_config_rows(db, config_dict)
@@ -994,6 +1284,8 @@ class Database:
 
             await db.commit()
 
+        self._config_cache.clear()
+
     async def reload_config_to_memory(self):
         """
         Reload all configuration from database to in-memory Config instance.
@@ -1007,6 +1299,9 @@ class Database:
         """
         from .config import config
 
+        # Drop cached rows so the reload reads fresh values
+        self._config_cache.clear()
+
         # Reload admin config
         admin_config = await self.get_admin_config()
         if admin_config:
@@ -1042,18 +1337,23 @@ class Database:
     # Cache config operations
     async def get_cache_config(self) -> CacheConfig:
         """Get cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self._config_cache.get("cache_config")
+        if cached is not None:
+            return cached
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
-                return CacheConfig(**dict(row))
+                result = CacheConfig(**dict(row))
+                self._config_cache.set("cache_config", result)
+                return result
             # Return default if not found
             return CacheConfig(cache_enabled=False, cache_timeout=7200)
 
     async def update_cache_config(self, enabled: bool = None, timeout: int = None, base_url: Optional[str] = None):
         """Update cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             # Get current values
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
@@ -1088,16 +1388,24 @@ class Database:
 
             await db.commit()
 
+        # Invalidate cached row after commit
+        self._config_cache.pop("cache_config")
+
     # Debug config operations
     async def get_debug_config(self) -> 'DebugConfig':
         """Get debug configuration"""
+        cached = self._config_cache.get("debug_config")
+        if cached is not None:
+            return cached
         from .models import DebugConfig
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
-                return DebugConfig(**dict(row))
+                result = DebugConfig(**dict(row))
+                self._config_cache.set("debug_config", result)
+                return result
             # Return default if not found
             return DebugConfig(enabled=False, log_requests=True, log_responses=True, mask_token=True)
 
@@ -1109,7 +1417,7 @@ class Database:
         mask_token: bool = None
     ):
         """Update debug configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             # Get current values
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
@@ -1142,15 +1450,23 @@ class Database:
 
             await db.commit()
 
+        # Invalidate cached row after commit
+        self._config_cache.pop("debug_config")
+
     # Captcha config operations
     async def get_captcha_config(self) -> CaptchaConfig:
         """Get captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self._config_cache.get("captcha_config")
+        if cached is not None:
+            return cached
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
-                return CaptchaConfig(**dict(row))
+                result = CaptchaConfig(**dict(row))
+                self._config_cache.set("captcha_config", result)
+                return result
             return CaptchaConfig()
 
     async def update_captcha_config(
@@ -1159,10 +1475,12 @@ class Database:
         yescaptcha_api_key: str = None,
         yescaptcha_base_url: str = None,
         browser_proxy_enabled: bool = None,
-        browser_proxy_url: str = None
+        browser_proxy_url: str = None,
+        browser_max_concurrency: int = None,
+        browser_simulate_human: bool = None
     ):
         """Update captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1174,41 +1492,54 @@ class Database:
                 new_base_url = yescaptcha_base_url if yescaptcha_base_url is not None else current.get("yescaptcha_base_url", "https://api.yescaptcha.com")
                 new_proxy_enabled = browser_proxy_enabled if browser_proxy_enabled is not None else current.get("browser_proxy_enabled", False)
                 new_proxy_url = browser_proxy_url if browser_proxy_url is not None else current.get("browser_proxy_url")
+                new_max_concurrency = browser_max_concurrency if browser_max_concurrency is not None else current.get("browser_max_concurrency", 4)
+                new_simulate_human = browser_simulate_human if browser_simulate_human is not None else current.get("browser_simulate_human", False)
 
                 await db.execute("""
                     UPDATE captcha_config
                     SET captcha_method = ?, yescaptcha_api_key = ?, yescaptcha_base_url = ?,
-                        browser_proxy_enabled = ?, browser_proxy_url = ?, updated_at = CURRENT_TIMESTAMP
+                        browser_proxy_enabled = ?, browser_proxy_url = ?, browser_max_concurrency = ?,
+                        browser_simulate_human = ?, updated_at = CURRENT_TIMESTAMP
                     WHERE id = 1
-                """, (new_method, new_api_key, new_base_url, new_proxy_enabled, new_proxy_url))
+                """, (new_method, new_api_key, new_base_url, new_proxy_enabled, new_proxy_url, new_max_concurrency, new_simulate_human))
             else:
                 new_method = captcha_method if captcha_method is not None else "yescaptcha"
                 new_api_key = yescaptcha_api_key if yescaptcha_api_key is not None else ""
                 new_base_url = yescaptcha_base_url if yescaptcha_base_url is not None else "https://api.yescaptcha.com"
                 new_proxy_enabled = browser_proxy_enabled if browser_proxy_enabled is not None else False
                 new_proxy_url = browser_proxy_url
+                new_max_concurrency = browser_max_concurrency if browser_max_concurrency is not None else 4
+                new_simulate_human = browser_simulate_human if browser_simulate_human is not None else False
 
                 await db.execute("""
-                    INSERT INTO captcha_config (id, captcha_method, yescaptcha_api_key, yescaptcha_base_url, browser_proxy_enabled, browser_proxy_url)
-                    VALUES (1, ?, ?, ?, ?, ?)
-                """, (new_method, new_api_key, new_base_url, new_proxy_enabled, new_proxy_url))
+                    INSERT INTO captcha_config (id, captcha_method, yescaptcha_api_key, yescaptcha_base_url, browser_proxy_enabled, browser_proxy_url, browser_max_concurrency, browser_simulate_human)
+                    VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+                """, (new_method, new_api_key, new_base_url, new_proxy_enabled, new_proxy_url, new_max_concurrency, new_simulate_human))
 
             await db.commit()
 
+        # Invalidate cached row after commit
+        self._config_cache.pop("captcha_config")
+
     # Plugin config operations
     async def get_plugin_config(self) -> PluginConfig:
         """Get plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self._config_cache.get("plugin_config")
+        if cached is not None:
+            return cached
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
-                return PluginConfig(**dict(row))
+                result = PluginConfig(**dict(row))
+                self._config_cache.set("plugin_config", result)
+                return result
             return PluginConfig()
 
     async def update_plugin_config(self, connection_token: str):
         """Update plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1226,3 +1557,6 @@ class Database:
                 """, (connection_token,))
 
             await db.commit()
+
+        # Invalidate cached row after commit
+        self._config_cache.pop("plugin_config")
@@ -1,6 +1,8 @@
 """Debug logger module for detailed API request/response logging"""
 import json
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional
@@ -11,6 +13,7 @@ class DebugLogger:
 
     def __init__(self):
         self.log_file = Path("logs.txt")
+        self._listener: Optional[QueueListener] = None
         self._setup_logger()
 
     def _setup_logger(self):
@@ -37,12 +40,22 @@ class DebugLogger:
         )
         file_handler.setFormatter(formatter)
 
-        # Add handler
-        self.logger.addHandler(file_handler)
+        # Callers only enqueue records; file writes happen on the listener thread,
+        # so large request/response dumps never block the event loop
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(QueueHandler(log_queue))
+        self._listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        self._listener.start()
 
         # Prevent propagation to root logger
         self.logger.propagate = False
 
+    def stop(self):
+        """Flush queued records and stop the writer thread (called on shutdown)"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
     def _mask_token(self, token: str) -> str:
         """Mask token for logging (show first 6 and last 6 characters)"""
         if not config.debug_mask_token or len(token) <= 12:
@@ -230,20 +243,24 @@ class DebugLogger:
         except Exception as e:
             self.logger.error(f"Error logging error: {e}")
 
-    def log_info(self, message: str):
-        """Log general info message to log.txt"""
+    def log_info(self, message: str, *args):
+        """Log general info message to log.txt (args are %-formatted only when enabled)"""
         if not config.debug_enabled:
             return
         try:
+            if args:
+                message = message % args
             self.logger.info(f"ℹ️  [{self._format_timestamp()}] {message}")
         except Exception as e:
             self.logger.error(f"Error logging info: {e}")
 
-    def log_warning(self, message: str):
-        """Log warning message to log.txt"""
+    def log_warning(self, message: str, *args):
+        """Log warning message to log.txt (args are %-formatted only when enabled)"""
         if not config.debug_enabled:
             return
         try:
+            if args:
+                message = message % args
             self.logger.warning(f"⚠️  [{self._format_timestamp()}] {message}")
         except Exception as e:
             self.logger.error(f"Error logging warning: {e}")
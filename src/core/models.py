@@ -154,6 +154,8 @@ class CaptchaConfig(BaseModel):
     page_action: str = "FLOW_GENERATION"
     browser_proxy_enabled: bool = False  # 浏览器打码是否启用代理
     browser_proxy_url: Optional[str] = None  # 浏览器打码代理URL
+    browser_max_concurrency: int = 4  # 浏览器打码最大并发数
+    browser_simulate_human: bool = False  # 浏览器打码前是否模拟鼠标移动/滚动和随机停顿
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -0,0 +1,25 @@
+"""Datetime parsing helpers"""
+from datetime import datetime
+from typing import Optional
+
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
+
+def parse_at_expires(value: Optional[str]) -> Optional[datetime]:
+    """Parse the ISO-8601 'expires' returned by ST->AT, None if empty or malformed
+
+    Uses ciso8601 (C parser) when installed, stdlib fromisoformat otherwise.
+    """
+    if not value:
+        return None
+    try:
+        if ciso8601:
+            return ciso8601.parse_datetime(value)
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
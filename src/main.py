@@ -1,19 +1,30 @@
 """FastAPI application initialization"""
+import asyncio
+import heapq
+import traceback
+from datetime import datetime, timezone, timedelta
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 from pathlib import Path
 
 from .core.config import config
 from .core.database import Database
+from .core.time_utils import parse_at_expires
+from .core.logger import debug_logger
 from .services.flow_client import FlowClient
 from .services.proxy_manager import ProxyManager
 from .services.token_manager import TokenManager
 from .services.load_balancer import LoadBalancer
 from .services.concurrency_manager import ConcurrencyManager
 from .services.generation_handler import GenerationHandler
+from .services.session_manager import get_session_manager
+from .services.browser_pool import (
+    new_context, wait_for_cookies, save_storage_state, spawn_token_task, cancel_browser_tasks, close_browser
+)
 from .api import routes, admin
 
 
@@ -44,30 +55,30 @@ async def lifespan(app: FastAPI):
         await db.check_and_migrate_db(config_dict)
         print("✓ Database migration check completed.")
 
-    # Load admin config from database
-    admin_config = await db.get_admin_config()
+    # Load persisted configuration (independent tables, fetched concurrently)
+    admin_config, cache_config, generation_config, debug_config, captcha_config, tokens = await asyncio.gather(
+        db.get_admin_config(),
+        db.get_cache_config(),
+        db.get_generation_config(),
+        db.get_debug_config(),
+        db.get_captcha_config(),
+        token_manager.get_all_tokens(),
+    )
+
     if admin_config:
         config.set_admin_username_from_db(admin_config.username)
         config.set_admin_password_from_db(admin_config.password)
         config.api_key = admin_config.api_key
 
-    # Load cache configuration from database
-    cache_config = await db.get_cache_config()
     config.set_cache_enabled(cache_config.cache_enabled)
     config.set_cache_timeout(cache_config.cache_timeout)
     config.set_cache_base_url(cache_config.cache_base_url or "")
 
-    # Load generation configuration from database
-    generation_config = await db.get_generation_config()
     config.set_image_timeout(generation_config.image_timeout)
     config.set_video_timeout(generation_config.video_timeout)
 
-    # Load debug configuration from database
-    debug_config = await db.get_debug_config()
     config.set_debug_enabled(debug_config.enabled)
 
-    # Load captcha configuration from database
-    captcha_config = await db.get_captcha_config()
     config.set_captcha_method(captcha_config.captcha_method)
     config.set_yescaptcha_api_key(captcha_config.yescaptcha_api_key)
     config.set_yescaptcha_base_url(captcha_config.yescaptcha_base_url)
@@ -85,93 +96,116 @@ async def lifespan(app: FastAPI):
         print("✓ Browser captcha service initialized (headless mode)")
 
     # Initialize concurrency manager
-    tokens = await token_manager.get_all_tokens()
     await concurrency_manager.initialize(tokens)
 
     # Start file cache cleanup task
     await generation_handler.file_cache.start_cleanup_task()
 
     # Start 429 auto-unban task
-    import asyncio
     async def auto_unban_task():
-        """定时任务：每小时检查并解禁429被禁用的token"""
+        """定时任务：在最早的429禁用到期时解禁token，新的429禁用会立即重新调度"""
         while True:
             try:
-                await asyncio.sleep(3600)  # 每小时执行一次
-                await token_manager.auto_unban_429_tokens()
+                next_unban = await token_manager.auto_unban_429_tokens()
+                if next_unban:
+                    sleep_seconds = max(30, (next_unban - datetime.now(timezone.utc)).total_seconds())
+                else:
+                    sleep_seconds = 3600  # 没有待解禁的token，每小时兜底检查一次
+                await token_manager.wait_for_unban_wake(sleep_seconds)
             except Exception as e:
                 print(f"❌ Auto-unban task error: {e}")
+                await asyncio.sleep(300)
 
     auto_unban_task_handle = asyncio.create_task(auto_unban_task())
 
+    # Start admin session sweep task
+    async def admin_session_sweep_task():
+        """定时任务：每10分钟清理过期的管理后台会话"""
+        while True:
+            try:
+                await asyncio.sleep(600)
+                removed = await db.delete_expired_admin_sessions()
+                if removed:
+                    print(f"🧹 Removed {removed} expired admin session(s)")
+            except Exception as e:
+                print(f"❌ Admin session sweep task error: {e}")
+
+    admin_session_sweep_task_handle = asyncio.create_task(admin_session_sweep_task())
+
     # Start auto ST refresh task - smart scheduling based on token expiry times
-    from .services.session_manager import get_session_manager
-    from datetime import datetime, timezone, timedelta
-    
     async def auto_st_refresh_task():
-        """智能任务：根据Token过期时间自动调度刷新，不浪费性能轮询"""
+        """智能任务：根据Token过期时间自动调度刷新，不浪费性能轮询
+
+        到期时间保存在最小堆中，仅在Token数据变化时重建，每次唤醒只弹出到期的Token。
+        """
         session_mgr = get_session_manager()
+        refresh_buffer = timedelta(hours=2)
+        expiry_heap = []  # (at_expires, token_id)
+        heap_gen = None
         
         while True:
             try:
-                tokens = await token_manager.get_all_tokens()
-                now = datetime.now(timezone.utc)
+                # Rebuild the heap only when token data changed since the last build
+                if heap_gen != token_manager.tokens_gen:
+                    heap_gen = token_manager.tokens_gen
+                    tokens = await token_manager.get_all_tokens()
+                    expiry_heap = [(t.at_expires, t.id) for t in tokens if t.is_active and t.at_expires]
+                    heapq.heapify(expiry_heap)
                 
-                # Find the next token that will expire
-                next_refresh_time = None
-                tokens_to_refresh = []
+                now = datetime.now(timezone.utc)
                 
-                for token in tokens:
-                    if not token.is_active or not token.at_expires:
-                        continue
-                    
-                    # Check if already expired or will expire in 2 hours
-                    time_until_expiry = (token.at_expires - now).total_seconds()
-                    
-                    if time_until_expiry <= 7200:  # Already expired or will expire in 2 hours
-                        if session_mgr.has_session(token.id):
-                            tokens_to_refresh.append(token)
-                    elif next_refresh_time is None or token.at_expires < next_refresh_time:
-                        # Track the soonest expiring token (minus 2 hour buffer)
-                        next_refresh_time = token.at_expires - timedelta(hours=2)
+                # Pop tokens that are expired or will expire in 2 hours
+                due_ids = []
+                while expiry_heap and expiry_heap[0][0] - refresh_buffer <= now:
+                    _, token_id = heapq.heappop(expiry_heap)
+                    due_ids.append(token_id)
+                    # Retry in 1 hour unless a successful refresh rebuilds the heap first
+                    heapq.heappush(expiry_heap, (now + refresh_buffer + timedelta(hours=1), token_id))
                 
                 # Refresh any currently expired tokens
-                for token in tokens_to_refresh:
-                    print(f"[AutoSTRefresh] Token {token.id} ({token.email}) 过期，开始刷新...")
-                    
-                    import threading
-                    def run_refresh(tid=token.id):
-                        import asyncio as async_loop
-                        async_loop.run(_auto_refresh_st(tid, session_mgr, token_manager, db))
+                for token_id in due_ids:
+                    if not session_mgr.has_session(token_id):
+                        continue
+                    print(f"[AutoSTRefresh] Token {token_id} 过期，开始刷新...")
                     
-                    thread = threading.Thread(target=run_refresh, daemon=True)
-                    thread.start()
+                    # Run on this loop so it can use the shared Playwright browser (skipped if a manual refresh is running)
+                    refresh_task = spawn_token_task(
+                        token_id,
+                        _auto_refresh_st(token_id, session_mgr, token_manager, db),
+                        name=f"auto-st-refresh-{token_id}"
+                    )
+                    if refresh_task is None:
+                        print(f"[AutoSTRefresh] Token {token_id} 已有浏览器任务在运行，跳过")
+                        continue
                     await asyncio.sleep(5)  # Small delay between refreshes
                 
                 # Calculate sleep time until next token expires
-                if next_refresh_time:
+                if expiry_heap:
+                    next_refresh_time = expiry_heap[0][0] - refresh_buffer
                     sleep_seconds = max(10, (next_refresh_time - datetime.now(timezone.utc)).total_seconds())
                     print(f"[AutoSTRefresh] 下一个Token将在 {int(sleep_seconds)}秒 后过期，等待中...")
-                    await asyncio.sleep(sleep_seconds)
                 else:
                     # No tokens with expiry time, check again in 1 hour
+                    sleep_seconds = 3600
                     print("[AutoSTRefresh] 没有需要刷新的Token，1小时后再检查")
-                    await asyncio.sleep(3600)
+                
+                # Added / edited tokens wake the scheduler early
+                await token_manager.wait_for_expiry_wake(sleep_seconds)
                 
             except Exception as e:
                 print(f"❌ Auto ST refresh task error: {e}")
-                import traceback
                 traceback.print_exc()
                 await asyncio.sleep(300)  # Error occurred, wait 5 min
     
     auto_st_refresh_task_handle = asyncio.create_task(auto_st_refresh_task())
 
-    print(f"✓ Database initialized")
+    print("✓ Database initialized")
     print(f"✓ Total tokens: {len(tokens)}")
     print(f"✓ Cache: {'Enabled' if config.cache_enabled else 'Disabled'} (timeout: {config.cache_timeout}s)")
-    print(f"✓ File cache cleanup task started")
-    print(f"✓ 429 auto-unban task started (runs every hour)")
-    print(f"✓ Auto ST refresh task started (checks every 60s)")
+    print("✓ File cache cleanup task started")
+    print("✓ 429 auto-unban task started (scheduled by ban expiry)")
+    print("✓ Admin session sweep task started (runs every 10 minutes)")
+    print("✓ Auto ST refresh task started (checks every 60s)")
     print(f"✓ Server running on http://{config.server_host}:{config.server_port}")
     print("=" * 60)
 
@@ -187,18 +221,36 @@ async def lifespan(app: FastAPI):
         await auto_unban_task_handle
     except asyncio.CancelledError:
         pass
+    # Stop admin session sweep task
+    admin_session_sweep_task_handle.cancel()
+    try:
+        await admin_session_sweep_task_handle
+    except asyncio.CancelledError:
+        pass
     # Stop auto ST refresh task
     auto_st_refresh_task_handle.cancel()
     try:
         await auto_st_refresh_task_handle
     except asyncio.CancelledError:
         pass
+    # Flush pending config reload
+    await admin.stop_config_reload_worker()
+    # Close shared HTTP session
+    await flow_client.close()
     # Close browser if initialized
     if browser_service:
         await browser_service.close()
         print("✓ Browser captcha service closed")
+    # Close shared session browser (login / ST refresh tasks)
+    await cancel_browser_tasks()
+    await close_browser()
+    # Close pooled database connections
+    await db.close()
+    # Flush queued debug log records
+    debug_logger.stop()
     print("✓ File cache cleanup task stopped")
     print("✓ 429 auto-unban task stopped")
+    print("✓ Admin session sweep task stopped")
     print("✓ Auto ST refresh task stopped")
 
 
@@ -227,6 +279,7 @@ app = FastAPI(
     title="Flow2API",
     description="OpenAI-compatible API for Google VideoFX (Veo)",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -239,6 +292,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gzip for large admin JSON payloads only (streaming generation responses must not be buffered)
+class AdminGZipMiddleware:
+    """Apply GZipMiddleware to a fixed set of admin API paths"""
+
+    GZIP_PATHS = frozenset({"/api/tokens", "/api/logs", "/api/stats"})
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.GZIP_PATHS:
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+app.add_middleware(AdminGZipMiddleware, minimum_size=1024)
+
 # Include routers
 app.include_router(routes.router)
 app.include_router(admin.router)
@@ -251,59 +323,47 @@ app.mount("/tmp", StaticFiles(directory=str(tmp_dir)), name="tmp")
 # HTML routes for frontend
 static_path = Path(__file__).parent.parent / "static"
 
+# Resolve frontend pages once at import instead of stat-ing on every request
+LOGIN_PAGE = static_path / "login.html" if (static_path / "login.html").exists() else None
+MANAGE_PAGE = static_path / "manage.html" if (static_path / "manage.html").exists() else None
+PAGE_HEADERS = {"Cache-Control": "public, max-age=300"}
+
 
 @app.get("/", response_class=HTMLResponse)
 async def index():
     """Redirect to login page"""
-    login_file = static_path / "login.html"
-    if login_file.exists():
-        return FileResponse(str(login_file))
+    if LOGIN_PAGE:
+        return FileResponse(LOGIN_PAGE, headers=PAGE_HEADERS)
     return HTMLResponse(content="<h1>Flow2API</h1><p>Frontend not found</p>", status_code=404)
 
 
 @app.get("/login", response_class=HTMLResponse)
 async def login_page():
     """Login page"""
-    login_file = static_path / "login.html"
-    if login_file.exists():
-        return FileResponse(str(login_file))
+    if LOGIN_PAGE:
+        return FileResponse(LOGIN_PAGE, headers=PAGE_HEADERS)
     return HTMLResponse(content="<h1>Login Page Not Found</h1>", status_code=404)
 
 
 @app.get("/manage", response_class=HTMLResponse)
 async def manage_page():
     """Management console page"""
-    manage_file = static_path / "manage.html"
-    if manage_file.exists():
-        return FileResponse(str(manage_file))
+    if MANAGE_PAGE:
+        return FileResponse(MANAGE_PAGE, headers=PAGE_HEADERS)
     return HTMLResponse(content="<h1>Management Page Not Found</h1>", status_code=404)
 
 
 async def _auto_refresh_st(token_id: int, session_mgr, token_manager, db):
     """使用浏览器Session自动刷新ST"""
-    from playwright.async_api import async_playwright
-    import os
-    
+    flow = token_manager.flow_client
     auth_path = session_mgr.get_session_path(token_id)
     
+    context = None
     try:
-        print(f"[AutoSTRefresh] Token {token_id}: 启动浏览器获取新ST...")
+        print(f"[AutoSTRefresh] Token {token_id}: 打开浏览器获取新ST...")
         
-        # Create headless browser with saved session
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(
-            headless=False,  # 有头模式，显示浏览器完成OAuth
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-            ]
-        )
-        
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            storage_state=auth_path
-        )
+        # Shared browser (有头模式，显示浏览器完成OAuth) + isolated context with saved session
+        context = await new_context(storage_state=auth_path)
         
         page = await context.new_page()
         
@@ -311,44 +371,30 @@ async def _auto_refresh_st(token_id: int, session_mgr, token_manager, db):
         print(f"[AutoSTRefresh] Token {token_id}: 打开 labs.google...")
         await page.goto("https://labs.google/fx/tools/flow", timeout=60000)
         
-        # Wait for page to load
-        await page.wait_for_timeout(3000)
-        
-        # Click "Create with Flow" button to trigger OAuth login
+        # Click "Create with Flow" button to trigger OAuth login (wait in-page until it renders, max 3s)
         try:
             create_button = page.get_by_text("Create with Flow")
-            if await create_button.is_visible():
-                print(f"[AutoSTRefresh] Token {token_id}: 点击 'Create with Flow' 按钮...")
-                await create_button.click()
+            await create_button.wait_for(state="visible", timeout=3000)
+            print(f"[AutoSTRefresh] Token {token_id}: 点击 'Create with Flow' 按钮...")
+            await create_button.click()
         except:
             pass
         
         # Wait for OAuth to complete and session-token to appear (max 2 minutes)
         print(f"[AutoSTRefresh] Token {token_id}: 等待登录完成 (最多120秒)...")
-        st_value = None
-        for _ in range(24):  # 24 * 5s = 120 seconds
-            await page.wait_for_timeout(5000)
-            
-            # Check for session token cookie
-            cookies = await context.cookies(["https://labs.google"])
-            for cookie in cookies:
-                if cookie['name'] == '__Secure-next-auth.session-token':
-                    st_value = cookie['value']
-                    print(f"[AutoSTRefresh] Token {token_id}: ✅ 找到 session-token!")
-                    break
-            
-            if st_value:
-                break
-            
-            # Save session periodically
-            await context.storage_state(path=auth_path)
+        st_cookies = await wait_for_cookies(
+            page, ("__Secure-next-auth.session-token",), timeout=120, urls=["https://labs.google"]
+        )
+        st_value = st_cookies["__Secure-next-auth.session-token"] if st_cookies else None
+        if st_value:
+            print(f"[AutoSTRefresh] Token {token_id}: ✅ 找到 session-token!")
         
-        # Save updated session
-        await context.storage_state(path=auth_path)
+        # Save updated session (only rewritten when cookies / storage changed)
+        await save_storage_state(context, auth_path)
         
-        # Close browser
-        await browser.close()
-        await playwright.stop()
+        # Release the context (shared browser stays up)
+        await context.close()
+        context = None
         
         if st_value:
             print(f"[AutoSTRefresh] Token {token_id}: ✅ 获取到新ST!")
@@ -359,19 +405,14 @@ async def _auto_refresh_st(token_id: int, session_mgr, token_manager, db):
             
             # Now refresh AT using the new ST
             try:
-                result = await token_manager.flow_client.st_to_at(st_value)
+                result = await flow.st_to_at(st_value)
                 new_at = result["access_token"]
                 expires = result.get("expires")
                 
-                from datetime import datetime
-                new_at_expires = None
-                if expires:
-                    try:
-                        new_at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                    except:
-                        pass
+                new_at_expires = parse_at_expires(expires)
                 
                 await db.update_token(token_id, at=new_at, at_expires=new_at_expires)
+                token_manager.mark_tokens_changed()
                 print(f"[AutoSTRefresh] Token {token_id}: ✅ AT已刷新! 新过期时间: {new_at_expires}")
             except Exception as e:
                 print(f"[AutoSTRefresh] Token {token_id}: ⚠️ ST转AT失败: {e}")
@@ -379,7 +420,12 @@ async def _auto_refresh_st(token_id: int, session_mgr, token_manager, db):
             print(f"[AutoSTRefresh] Token {token_id}: ⚠️ 未能获取新ST，可能需要重新登录")
             
     except Exception as e:
-        import traceback
         print(f"[AutoSTRefresh] Token {token_id}: ❌ 刷新失败: {e}")
         traceback.print_exc()
+    finally:
+        if context:
+            try:
+                await context.close()
+            except Exception:
+                pass
 
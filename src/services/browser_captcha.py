@@ -3,18 +3,91 @@
 使用 Playwright 访问页面并执行 reCAPTCHA 验证
 """
 import asyncio
+import random
 import time
 import os
 import re
-import json
-from typing import Optional, Dict
-from playwright.async_api import async_playwright, Browser, BrowserContext
+from typing import Optional, Dict, Tuple
+from playwright.async_api import Browser, BrowserContext, Page, TimeoutError as PlaywrightTimeoutError
+# stealth 在模块加载时解析一次（None 表示未安装），在创建上下文时应用于其所有页面
 try:
-    from playwright_stealth import stealth
+    from playwright_stealth.stealth import stealth_async as _STEALTH
 except ImportError:
-    stealth = None
+    try:
+        from playwright_stealth import stealth_async as _STEALTH
+    except ImportError:
+        _STEALTH = None
 
 from ..core.logger import debug_logger
+from .browser_pool import LEAN_ARGS, get_playwright, get_browser, wait_for_cookies, save_storage_state
+
+# 每个账号的浏览器上下文复用时长，到期后关闭重建以回收页面/DOM内存
+CONTEXT_MAX_AGE_SECONDS = 1800
+# Session 保存合并窗口：同一时间段内的多次保存请求只写一次盘
+STATE_FLUSH_DELAY_SECONDS = 0.5
+# 已加载项目页面的复用时长，到期后关闭并重新访问（刷新 reCAPTCHA 脚本和页面状态）
+PAGE_MAX_AGE_SECONDS = 600
+
+# 页面加载时注入 reCAPTCHA v3 脚本 (with Trusted Types)，作为上下文 init script 对每个新页面生效
+# 只在 labs.google 顶层页面注入，避免进入 iframe（包括 reCAPTCHA 自身的 iframe）
+_RECAPTCHA_LOADER_JS = """
+(() => {
+    if (window.top !== window || location.hostname !== 'labs.google') return;
+
+    const inject = () => {
+        if (window.grecaptcha || document.querySelector('script[data-flow2api-recaptcha]')) return;
+
+        // 1. 尝试创建 Trusted Types Policy（页面启用 Trusted Types 时需要）
+        let policy = null;
+        if (window.trustedTypes && window.trustedTypes.createPolicy) {
+            try {
+                policy = window.trustedTypes.createPolicy('flow2api_policy', {
+                    createScriptURL: (string) => string,
+                });
+            } catch (e) {
+                console.warn('Failed to create Trusted Type policy:', e);
+            }
+        }
+
+        // 2. 创建并注入脚本
+        const url = 'https://www.google.com/recaptcha/api.js?render=__WEBSITE_KEY__';
+        const script = document.createElement('script');
+        try {
+            script.src = policy ? policy.createScriptURL(url) : url;
+        } catch (e) {
+            console.error('Failed to set script src:', e);
+            return;
+        }
+        script.async = true;
+        script.defer = true;
+        script.dataset.flow2apiRecaptcha = '1';
+        script.onerror = (e) => console.error('Script load error:', e);
+        document.head.appendChild(script);
+    };
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', inject, { once: true });
+    } else {
+        inject();
+    }
+})();
+"""
+
+# 打码只需要 reCAPTCHA 脚本，图片/字体/媒体请求在网络层直接丢弃（reCAPTCHA 自身资源除外）
+# 按URL匹配，只有命中的请求才会经过 Python 路由回调，其余请求不受影响
+_BLOCKED_RESOURCE_RE = re.compile(
+    r"^(?!.*/recaptcha/).*\.(?:png|jpe?g|gif|webp|avif|svg|ico|woff2?|ttf|otf|mp4|webm|mp3|m4a)(?:[?#].*)?$",
+    re.IGNORECASE
+)
+
+# 任一 Google 登录 Cookie 出现即视为已登录
+_AUTH_COOKIE_NAMES = frozenset({"__Secure-3PSID", "SID", "SAPISID", "APISID"})
+
+# grecaptcha.execute 可用即视为就绪
+_GRECAPTCHA_READY_JS = "() => !!(window.grecaptcha && typeof window.grecaptcha.execute === 'function')"
+
+# 代理URL格式: protocol://[username:password@]host:port
+_PROXY_RE = re.compile(r'^(socks5|http|https)://(?:([^:]+):([^@]+)@)?([^:]+):(\d+)$')
 
 
 def parse_proxy_url(proxy_url: str) -> Optional[Dict[str, str]]:
@@ -26,8 +99,7 @@ def parse_proxy_url(proxy_url: str) -> Optional[Dict[str, str]]:
     Returns:
         代理配置字典，包含server、username、password（如果有认证）
     """
-    proxy_pattern = r'^(socks5|http|https)://(?:([^:]+):([^@]+)@)?([^:]+):(\d+)$'
-    match = re.match(proxy_pattern, proxy_url)
+    match = _PROXY_RE.match(proxy_url)
 
     if match:
         protocol, username, password, host, port = match.groups()
@@ -80,36 +152,86 @@ def validate_browser_proxy_url(proxy_url: str) -> tuple[bool, str]:
     return False, f"不支持的代理协议：{protocol}"
 
 
+async def _abort_route(route):
+    """丢弃非必要的静态资源请求"""
+    await route.abort()
+
+
 class BrowserCaptchaService:
     """浏览器自动化获取 reCAPTCHA token（单例模式）"""
 
     _instance: Optional['BrowserCaptchaService'] = None
     _lock = asyncio.Lock()
+    # 首次 initialize 的共享任务，并发调用者等待同一次浏览器启动
+    _init_future: Optional[asyncio.Future] = None
 
     def __init__(self, db=None):
         """初始化服务（始终使用无头模式）"""
         self.headless = False  # 强制有头模式查看打码过程
         self.playwright = None
         self.browser: Optional[Browser] = None
+        # 未配置代理时复用 browser_pool 的共享浏览器，此时不由本服务关闭
+        self._owns_browser = False
         self._initialized = False
+        # 保证同时只有一个调用者在启动浏览器（启动失败或 close 后的重新初始化）
+        self._init_lock = asyncio.Lock()
         self.website_key = "6LdsFiUsAAAAAIjVDZcuLhaHiDn5nnHVXVRQGeMV"
         self.db = db
+        # token_id -> (上下文, 创建时间)，每次 get_token 只开关 Page
+        self._contexts: Dict[Optional[int], Tuple[BrowserContext, float]] = {}
+        self._context_lock = asyncio.Lock()
+        # 上下文 -> 正在使用它打码的请求数；到期时仍在使用的上下文延迟到最后一个请求结束再关闭
+        self._context_users: Dict[BrowserContext, int] = {}
+        self._retired_contexts: set = set()
+        # 已确认登录的账号（对应上下文存活期间有效），跳过每次的登录检测
+        self._logged_in = set()
+        # (token_id, project_id) -> (已加载 reCAPTCHA 的页面, 加载时间)，重复打码直接 execute
+        self._pages: Dict[Tuple[Optional[int], str], Tuple[Page, float]] = {}
+        # 限制同时使用浏览器的打码请求数，多余请求排队（按配置创建，配置变更时重建）
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_limit = 0
+        # 待保存的 Session: auth_path -> (上下文, token_id)，由后台任务合并写盘，不占用打码请求的耗时
+        self._dirty_states: Dict[str, Tuple[BrowserContext, Optional[int]]] = {}
+        self._dirty_event = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        # 是否在打码前模拟人类鼠标/滚动操作（每次额外耗时 2~5 秒，initialize 时按配置读取）
+        self.simulate_human = False
 
     @classmethod
     async def get_instance(cls, db=None) -> 'BrowserCaptchaService':
         """获取单例实例"""
         if cls._instance is None:
+            # 锁只保护实例创建，浏览器启动在锁外进行
             async with cls._lock:
                 if cls._instance is None:
                     cls._instance = cls(db)
-                    await cls._instance.initialize()
+                    cls._init_future = asyncio.ensure_future(cls._instance.initialize())
+
+        future = cls._init_future
+        if future is not None:
+            try:
+                # shield: 单个调用者被取消时不影响其他等待者和启动本身
+                await asyncio.shield(future)
+            except Exception:
+                # 启动失败时清除，后续 get_token 会重新尝试 initialize
+                if cls._init_future is future:
+                    cls._init_future = None
+                raise
         return cls._instance
 
     async def initialize(self):
         """初始化浏览器（启动一次）"""
+        # 已初始化时直接返回，不争用锁
         if self._initialized:
             return
-
+        async with self._init_lock:
+            # 等锁期间其他调用者可能已完成启动
+            if self._initialized:
+                return
+            await self._launch()
+
+    async def _launch(self):
+        """启动浏览器（由 initialize 在锁内调用）"""
         try:
             # 获取浏览器专用代理配置
             proxy_url = None
@@ -117,9 +239,11 @@ class BrowserCaptchaService:
                 captcha_config = await self.db.get_captcha_config()
                 if captcha_config.browser_proxy_enabled and captcha_config.browser_proxy_url:
                     proxy_url = captcha_config.browser_proxy_url
+                self.simulate_human = captcha_config.browser_simulate_human
 
-            debug_logger.log_info(f"[BrowserCaptcha] 正在启动浏览器... (proxy={proxy_url or 'None'})")
-            self.playwright = await async_playwright().start()
+            debug_logger.log_info("[BrowserCaptcha] 正在启动浏览器... (proxy=%s)", proxy_url or 'None')
+            # 与 browser_pool 共用同一个 Playwright 驱动进程
+            self.playwright = await get_playwright()
 
             # 配置浏览器启动参数
             launch_options = {
@@ -128,7 +252,8 @@ class BrowserCaptchaService:
                     '--disable-blink-features=AutomationControlled',
                     '--disable-dev-shm-usage',
                     '--no-sandbox',
-                    '--disable-setuid-sandbox'
+                    '--disable-setuid-sandbox',
+                    *LEAN_ARGS,
                 ]
             }
 
@@ -138,17 +263,141 @@ class BrowserCaptchaService:
                 if proxy_config:
                     launch_options['proxy'] = proxy_config
                     auth_info = "auth=yes" if 'username' in proxy_config else "auth=no"
-                    debug_logger.log_info(f"[BrowserCaptcha] 代理配置: {proxy_config['server']} ({auth_info})")
+                    debug_logger.log_info("[BrowserCaptcha] 代理配置: %s (%s)", proxy_config['server'], auth_info)
                 else:
-                    debug_logger.log_warning(f"[BrowserCaptcha] 代理URL格式错误: {proxy_url}")
+                    debug_logger.log_warning("[BrowserCaptcha] 代理URL格式错误: %s", proxy_url)
 
-            self.browser = await self.playwright.chromium.launch(**launch_options)
+            if 'proxy' in launch_options:
+                # 代理是浏览器级启动参数，需要独立的浏览器
+                self.browser = await self.playwright.chromium.launch(**launch_options)
+                self._owns_browser = True
+            else:
+                self.browser = await get_browser()
+                self._owns_browser = False
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._flush_loop())
             self._initialized = True
-            debug_logger.log_info(f"[BrowserCaptcha] ✅ 浏览器已启动 (headless={self.headless}, proxy={proxy_url or 'None'})")
+            debug_logger.log_info("[BrowserCaptcha] ✅ 浏览器已启动 (headless=%s, proxy=%s)", self.headless, proxy_url or 'None')
         except Exception as e:
             debug_logger.log_error(f"[BrowserCaptcha] ❌ 浏览器启动失败: {str(e)}")
             raise
 
+    async def _get_context(self, token_id: Optional[int], storage_state: Optional[str]) -> BrowserContext:
+        """获取该账号复用的浏览器上下文（不存在或已到期时新建）"""
+        async with self._context_lock:
+            cached = self._contexts.get(token_id)
+            if cached:
+                context, created_at = cached
+                if time.monotonic() - created_at < CONTEXT_MAX_AGE_SECONDS:
+                    return context
+                # 到期回收，重新从 Session 文件加载
+                debug_logger.log_info("[BrowserCaptcha] Token %s 上下文已到期，重建", token_id)
+                self._contexts.pop(token_id, None)
+                self._logged_in.discard(token_id)
+                # 该上下文的缓存页面不再分给新请求（随上下文一起关闭）
+                for page_key in [k for k, (p, _) in self._pages.items() if p.context is context]:
+                    self._pages.pop(page_key, None)
+                if self._context_users.get(context):
+                    debug_logger.log_info("[BrowserCaptcha] Token %s 旧上下文仍在打码，结束后关闭", token_id)
+                    self._retired_contexts.add(context)
+                else:
+                    await self._close_context(context)
+
+            # 创建新的上下文，使用与 API 请求一致的 User-Agent
+            context = await self.browser.new_context(
+                storage_state=storage_state,
+                viewport={'width': 1920, 'height': 1080},
+                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36',
+                locale='en-US',
+                timezone_id='America/New_York',
+                extra_http_headers={
+                    "sec-ch-ua": '"Chromium";v="110", "Not A(Brand";v="24", "Google Chrome";v="110"',
+                    "sec-ch-ua-mobile": "?0",
+                    "sec-ch-ua-platform": '"Windows"'
+                }
+            )
+            # 启用 stealth 模式规避检测（以 init script 注入，上下文内的所有页面自动生效）
+            if _STEALTH:
+                try:
+                    await _STEALTH(context)
+                    debug_logger.log_info("[BrowserCaptcha] Stealth 模式已启用")
+                except Exception as e:
+                    debug_logger.log_warning("[BrowserCaptcha] Stealth 模式启用失败: %s", e)
+            else:
+                debug_logger.log_warning("[BrowserCaptcha] playwright-stealth 未安装，无法启用隐身模式")
+            await context.add_init_script(script=_RECAPTCHA_LOADER_JS.replace("__WEBSITE_KEY__", self.website_key))
+            await context.route(_BLOCKED_RESOURCE_RE, _abort_route)
+            context.on("close", lambda _: self._evict_context(token_id, context))
+            self._contexts[token_id] = (context, time.monotonic())
+            return context
+
+    async def _acquire_context(self, token_id: Optional[int], storage_state: Optional[str]) -> BrowserContext:
+        """获取账号上下文并登记一次使用，用完必须调用 _release_context"""
+        context = await self._get_context(token_id, storage_state)
+        self._context_users[context] = self._context_users.get(context, 0) + 1
+        return context
+
+    async def _release_context(self, context: BrowserContext):
+        """结束一次使用；已到期的上下文在最后一个使用者结束时关闭"""
+        users = self._context_users.get(context, 0) - 1
+        if users > 0:
+            self._context_users[context] = users
+            return
+        self._context_users.pop(context, None)
+        if context in self._retired_contexts:
+            self._retired_contexts.discard(context)
+            await self._close_context(context)
+
+    @staticmethod
+    async def _close_context(context: BrowserContext):
+        """关闭上下文，失败只记录日志"""
+        try:
+            await context.close()
+        except Exception as e:
+            debug_logger.log_warning("[BrowserCaptcha] 关闭上下文异常: %s", e)
+
+    def _evict_context(self, token_id: Optional[int], context: BrowserContext):
+        """上下文被关闭时移出缓存"""
+        cached = self._contexts.get(token_id)
+        if cached and cached[0] is context:
+            self._contexts.pop(token_id, None)
+            self._logged_in.discard(token_id)
+        self._retired_contexts.discard(context)
+
+    async def _get_cached_page(self, key: Tuple[Optional[int], str]) -> Optional[Page]:
+        """获取已加载该项目的页面，不存在、已关闭或已到期时返回None"""
+        cached = self._pages.get(key)
+        if not cached:
+            return None
+        page, loaded_at = cached
+        if not page.is_closed() and time.monotonic() - loaded_at < PAGE_MAX_AGE_SECONDS:
+            return page
+        # 到期后关闭，本次重新访问页面
+        self._pages.pop(key, None)
+        await self._close_page(page)
+        return None
+
+    @staticmethod
+    async def _close_page(page: Page):
+        """关闭页面（不执行 beforeunload），失败只记录日志"""
+        try:
+            await page.close(run_before_unload=False)
+        except Exception as e:
+            debug_logger.log_warning("[BrowserCaptcha] 关闭页面异常: %s", e)
+
+    def _cache_page(self, key: Tuple[Optional[int], str], page: Page):
+        """缓存已就绪的页面（并发请求已缓存同一项目时保留先缓存的）"""
+        if key in self._pages:
+            return
+        self._pages[key] = (page, time.monotonic())
+        page.on("close", lambda _: self._evict_page(key, page))
+
+    def _evict_page(self, key: Tuple[Optional[int], str], page: Page):
+        """页面被关闭或失效时移出缓存"""
+        cached = self._pages.get(key)
+        if cached and cached[0] is page:
+            self._pages.pop(key, None)
+
     async def get_token(self, project_id: str, token_id: int = None) -> Optional[str]:
         """获取 reCAPTCHA token
 
@@ -162,8 +411,29 @@ class BrowserCaptchaService:
         if not self._initialized:
             await self.initialize()
 
+        # 超出并发上限的请求在此排队，避免同时打开过多页面拖垮浏览器
+        async with await self._get_semaphore():
+            return await self._fetch_token(project_id, token_id)
+
+    async def _get_semaphore(self) -> asyncio.Semaphore:
+        """获取打码并发信号量（上限取 captcha_config.browser_max_concurrency，变更后重建）"""
+        limit = 4
+        if self.db:
+            captcha_config = await self.db.get_captcha_config()
+            limit = captcha_config.browser_max_concurrency
+        limit = max(1, limit)
+        if self._semaphore is None or limit != self._semaphore_limit:
+            # 进行中的请求仍在旧信号量上释放，新请求按新上限排队
+            self._semaphore = asyncio.Semaphore(limit)
+            self._semaphore_limit = limit
+        return self._semaphore
+
+    async def _fetch_token(self, project_id: str, token_id: Optional[int]) -> Optional[str]:
+        """在已占用并发名额的情况下执行一次打码"""
         start_time = time.time()
-        context = None
+        page: Optional[Page] = None
+        context: Optional[BrowserContext] = None
+        key = (token_id, project_id)
 
         try:
             # 1. 尝试加载保存的登录状态 (如果存在)
@@ -171,224 +441,31 @@ class BrowserCaptchaService:
             from .session_manager import get_session_manager
             session_mgr = get_session_manager()
             
-            debug_logger.log_info(f"[BrowserCaptcha] get_token called with token_id={token_id}")
+            debug_logger.log_info("[BrowserCaptcha] get_token called with token_id=%s", token_id)
             
             if token_id:
                 auth_path = session_mgr.get_session_path(token_id)
+                # SessionManager 已记录哪些账号有 Session 文件，无需每次 stat
+                has_state = session_mgr.has_session(token_id)
             else:
                 auth_path = "auth.json"  # Fallback for legacy calls
+                has_state = os.path.exists(auth_path)
             
-            load_state = auth_path if os.path.exists(auth_path) else None
+            load_state = auth_path if has_state else None
             if load_state:
-                debug_logger.log_info(f"[BrowserCaptcha] 发现 {auth_path}，将加载 Token {token_id} 的 Session...")
-            else:
-                debug_logger.log_info(f"[BrowserCaptcha] Token {token_id} 无已保存的 Session，需要手动登录")
-
-            # 创建新的上下文，使用与 API 请求一致的 User-Agent
-            context = await self.browser.new_context(
-                storage_state=load_state,
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36',
-                locale='en-US',
-                timezone_id='America/New_York',
-                extra_http_headers={
-                    "sec-ch-ua": '"Chromium";v="110", "Not A(Brand";v="24", "Google Chrome";v="110"',
-                    "sec-ch-ua-mobile": "?0",
-                    "sec-ch-ua-platform": '"Windows"'
-                }
-            )
-            page = await context.new_page()
-            
-            # 启用 stealth 模式规避检测
-            # 启用 stealth 模式规避检测
-            if stealth:
-                try:
-                    await stealth(page)
-                    debug_logger.log_info("[BrowserCaptcha] Stealth 模式已启用")
-                except Exception as e:
-                    debug_logger.log_warning(f"[BrowserCaptcha] Stealth 模式启用失败: {e}")
-            else:
-                debug_logger.log_warning("[BrowserCaptcha] playwright-stealth 未安装，无法启用隐身模式")
-
-            # 模拟一些随机行为
-            import random
-            await page.mouse.move(random.randint(100, 500), random.randint(100, 500))
-            await asyncio.sleep(random.uniform(1, 2))
-
-            website_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
-
-            debug_logger.log_info(f"[BrowserCaptcha] 访问页面: {website_url}")
-
-            # 访问页面
-            try:
-                await page.goto(website_url, wait_until="domcontentloaded", timeout=30000)
-            except Exception as e:
-                debug_logger.log_warning(f"[BrowserCaptcha] 页面加载超时或失败: {str(e)}")
-
-            # 检查并注入 reCAPTCHA v3 脚本
-            debug_logger.log_info("[BrowserCaptcha] 检查并加载 reCAPTCHA v3 脚本...")
-            
-            # --- Smart Login Check ---
-            # 检查是否已登录 (通过查找正向特征：头像、Google Account 元素)
-            is_logged_in = False
-            try:
-                debug_logger.log_info("[BrowserCaptcha] 正在检查登录状态 (Positive Check)...")
-                # 给一点时间渲染
-                await asyncio.sleep(5)
-                
-                # 正向检测：查找明确表示已登录的元素
-                # 1. 查找 aria-label 包含 "Google Account" 或 "Google 帐号" 的元素 (通常是头像按钮)
-                # 2. 查找 img 元素作为头像
-                login_indicator = await page.query_selector('button[aria-label*="Google Account"], button[aria-label*="Google 帐号"], img[src*="googleusercontent.com"]')
-                
-                if login_indicator:
-                     debug_logger.log_info(f"[BrowserCaptcha] 发现登录特征元素: {login_indicator}")
-                     is_logged_in = True
-                else:
-                     # 二次检查页面内容，防止 selector 漏掉
-                     # 只有同时满足 "没有Sign in" 且 "有特定的 Dashboard 关键词" 才敢认为是登录
-                     # 这里为了稳妥，如果找不到头像，就默认认为未登录，强制让用户确认
-                     debug_logger.log_info("[BrowserCaptcha] 未发现明确登录特征 (头像等)，将请求用户介入")
-                     is_logged_in = False
-                     
-            except Exception as e:
-                debug_logger.log_warning(f"[BrowserCaptcha] 登录检测异常: {e}")
-                is_logged_in = False
-
-            if is_logged_in:
-                debug_logger.log_info("[BrowserCaptcha] 检测到已登录状态，跳过手动登录等待。")
-                print("\n✅ 检测到已登录，继续执行...")
-                # 即使已登录，也可以顺手更新一下 auth.json (以防 cookie 包含新的字段)
-                try:
-                    storage = await context.storage_state()
-                    with open(auth_path, 'w', encoding='utf-8') as f:
-                        json.dump(storage, f, ensure_ascii=False, indent=2)
-                except:
-                    pass
-
+                debug_logger.log_info("[BrowserCaptcha] 发现 %s，将加载 Token %s 的 Session...", auth_path, token_id)
             else:
-                # --- Unlogged State: Force Manual Login ---
-                print("\n" + "="*50)
-                print("!!! 未检测到登录状态 !!!")
-                print("请在 300秒 (5分钟) 内完成以下操作：")
-                print("1. 点击右上角 'Sign in' 登录你的 Google 账号")
-                print("2. 确保页面显示你的头像 (已登录状态)")
-                print("3. 程序会自动保存你的登录状态到 auth.json")
-                print("="*50 + "\n")
-                
-                # 循环等待，每秒检查一次是否登录成功
-                for i in range(300):
-                    if i % 10 == 0:
-                        print(f"⏳ 请登录... 窗口将保持打开，剩余 {300-i} 秒")
-                    
-                    # --- Auto-Save Strategy: Every 5 seconds ---
-                    if i % 5 == 0:
-                        try:
-                             # 尝试保存当前状态 (防止用户强制退出导致未保存)
-                             temp_storage = await context.storage_state()
-                             abs_path = os.path.abspath(auth_path)
-                             with open(auth_path, 'w', encoding='utf-8') as f:
-                                 json.dump(temp_storage, f, ensure_ascii=False, indent=2)
-                             # print(f"[Debug] 自动保存成功: {abs_path}")
-                        except Exception as e:
-                             pass # print(f"❌ 自动保存失败: {e}")
-                    
-                    await asyncio.sleep(1)
-                    
-                    # 尝试检测登录状态
-                    try:
-                        # 1. UI检测: 头像
-                        login_indicator = await page.query_selector('img[src*="googleusercontent.com"], a[href*="accounts.google.com/SignOut"]')
-                        
-                        # 2. Cookie检测: 关键Auth Cookie
-                        cookies = await context.cookies()
-                        has_auth_cookie = any(c['name'] == '__Secure-3PSID' or c['name'] == 'SID' for c in cookies)
-                        
-                        if login_indicator or has_auth_cookie:
-                             print("\n✅ 检测到登录成功 (UI/Cookie)，已自动保存，继续...")
-                             break 
-                    except:
-                        pass
-                
-                # 循环结束后再次保存，确保最终状态
-                try:
-                    storage = await context.storage_state()
-                    with open(auth_path, 'w', encoding='utf-8') as f:
-                        json.dump(storage, f, ensure_ascii=False, indent=2)
-                    print(f"✅ 登录状态已保存到 {auth_path}")
-                except Exception as e:
-                     print(f"❌ 保存登录状态失败: {e}")
-            debug_logger.log_info("[BrowserCaptcha] 注入 reCAPTCHA v3 脚本 (with Trusted Types)...")
-            
-            await page.evaluate(f"""
-                () => {{
-                    return new Promise((resolve) => {{
-                        // 1. 尝试创建或获取 Trusted Types Policy
-                        let policy = null;
-                        if (window.trustedTypes && window.trustedTypes.createPolicy) {{
-                            try {{
-                                policy = window.trustedTypes.createPolicy('flow2api_policy', {{
-                                    createScriptURL: (string) => string,
-                                }});
-                            }} catch (e) {{
-                                // 如果策略已存在 (例如 'default')，可能无法创建新 policy，尝试直接使用字符串
-                                console.warn('Failed to create Trusted Type policy:', e);
-                            }}
-                        }}
-
-                        // 2. 准备 URL
-                        const url = 'https://www.google.com/recaptcha/api.js?render={self.website_key}';
-                        let trustedUrl = url;
-                        
-                        if (policy) {{
-                            trustedUrl = policy.createScriptURL(url);
-                        }}
-
-                        // 3. 创建并注入脚本
-                        const script = document.createElement('script');
-                        // 尝试赋值，如果失败则说明需要 policy 但创建失败
-                        try {{
-                            script.src = trustedUrl;
-                        }} catch (e) {{
-                            console.error('Failed to set script src:', e);
-                            resolve(false);
-                            return;
-                        }}
-                        
-                        script.async = true;
-                        script.defer = true;
-                        script.onload = () => resolve(true);
-                        script.onerror = (e) => {{
-                            console.error('Script load error:', e);
-                            resolve(false);
-                        }};
-                        document.head.appendChild(script);
-                    }});
-                }}
-            """)
-            debug_logger.log_info("[BrowserCaptcha] reCAPTCHA 脚本注入尝试完成")
-
-            # 等待reCAPTCHA加载和初始化
-            debug_logger.log_info("[BrowserCaptcha] 等待reCAPTCHA初始化...")
-            for i in range(20):
-                grecaptcha_ready = await page.evaluate("""
-                    () => {
-                        return window.grecaptcha &&
-                               typeof window.grecaptcha.execute === 'function';
-                    }
-                """)
-                if grecaptcha_ready:
-                    debug_logger.log_info(f"[BrowserCaptcha] reCAPTCHA 已准备好（等待了 {i*0.5} 秒）")
-                    break
-                await asyncio.sleep(0.5)
+                debug_logger.log_info("[BrowserCaptcha] Token %s 无已保存的 Session，需要手动登录", token_id)
+
+            # 复用该账号的上下文；同一项目已加载过的页面直接复用
+            context = await self._acquire_context(token_id, load_state)
+            page = await self._get_cached_page(key)
+            reused = page is not None
+            if reused:
+                debug_logger.log_info("[BrowserCaptcha] 复用已加载的项目页面: %s", project_id)
             else:
-                debug_logger.log_warning("[BrowserCaptcha] reCAPTCHA 初始化超时，继续尝试执行...")
-
-            # 模拟人类滚动和停顿
-            await page.mouse.wheel(0, 500)
-            await asyncio.sleep(1)
-            await page.mouse.wheel(0, -200)
-            await asyncio.sleep(random.uniform(1, 3))
+                page = await context.new_page()
+                await self._prepare_page(page, context, project_id, token_id, auth_path)
 
             # 执行reCAPTCHA并获取token
             debug_logger.log_info("[BrowserCaptcha] 执行reCAPTCHA验证...")
@@ -438,45 +515,214 @@ class BrowserCaptchaService:
             duration_ms = (time.time() - start_time) * 1000
 
             if token:
-                debug_logger.log_info(f"[BrowserCaptcha] ✅ Token获取成功（耗时 {duration_ms:.0f}ms）")
+                debug_logger.log_info("[BrowserCaptcha] ✅ Token获取成功（耗时 %.0fms）", duration_ms)
+                if not reused:
+                    self._cache_page(key, page)
                 return token
             else:
                 debug_logger.log_error("[BrowserCaptcha] Token获取失败（返回null）")
+                # 可能是登录失效，下次重新检测并重新加载页面
+                self._logged_in.discard(token_id)
+                self._evict_page(key, page)
                 return None
 
         except Exception as e:
             debug_logger.log_error(f"[BrowserCaptcha] 获取token异常: {str(e)}")
+            self._logged_in.discard(token_id)
+            if page:
+                self._evict_page(key, page)
             return None
         finally:
-            # 关闭上下文
-            # debug模式下暂不关闭，由外部手动关闭
-            if context:
-                pass
-                # try:
-                #     await context.close()
-                # except:
-                #     pass
+            # 未缓存的 Page 用完即关，上下文留给下次复用
+            cached = self._pages.get(key)
+            if page and not (cached and cached[0] is page):
+                await self._close_page(page)
+            if context is not None:
+                await self._release_context(context)
+
+    async def _prepare_page(self, page: Page, context: BrowserContext, project_id: str, token_id: Optional[int], auth_path: str):
+        """在新页面中打开项目、确认登录并等待 reCAPTCHA 就绪"""
+        # 模拟一些随机行为
+        if self.simulate_human:
+            await page.mouse.move(random.randint(100, 500), random.randint(100, 500))
+            await asyncio.sleep(random.uniform(1, 2))
+
+        website_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
+
+        debug_logger.log_info("[BrowserCaptcha] 访问页面: %s", website_url)
+
+        # 访问页面：导航提交即返回，reCAPTCHA 脚本由 init script 在 DOM 就绪时注入
+        ready_start = time.monotonic()
+        try:
+            await page.goto(website_url, wait_until="commit", timeout=30000)
+        except Exception as e:
+            debug_logger.log_warning("[BrowserCaptcha] 页面加载超时或失败: %s", e)
+
+        # 立即开始在浏览器端等待 grecaptcha 就绪，与页面加载/登录检测并行
+        ready = asyncio.ensure_future(page.wait_for_function(_GRECAPTCHA_READY_JS, timeout=20000))
+        try:
+            # --- Smart Login Check ---
+            # 已确认登录的上下文跳过检测（省去固定的5秒等待）
+            if token_id in self._logged_in:
+                debug_logger.log_info("[BrowserCaptcha] Token %s 已确认登录，跳过登录检测", token_id)
+            elif await self._ensure_logged_in(page, context, token_id, auth_path):
+                self._logged_in.add(token_id)
+
+            # 等待reCAPTCHA加载和初始化
+            debug_logger.log_info("[BrowserCaptcha] 等待reCAPTCHA初始化...")
+            try:
+                await ready
+                debug_logger.log_info("[BrowserCaptcha] reCAPTCHA 已准备好（等待了 %.1f 秒）", time.monotonic() - ready_start)
+            except PlaywrightTimeoutError:
+                debug_logger.log_warning("[BrowserCaptcha] reCAPTCHA 初始化超时，继续尝试执行...")
+        finally:
+            if not ready.done():
+                ready.cancel()
+            await asyncio.gather(ready, return_exceptions=True)
+
+        # 模拟人类滚动和停顿
+        if self.simulate_human:
+            await page.mouse.wheel(0, 500)
+            await asyncio.sleep(1)
+            await page.mouse.wheel(0, -200)
+            await asyncio.sleep(random.uniform(1, 3))
+
+    async def _ensure_logged_in(self, page: Page, context: BrowserContext, token_id: Optional[int], auth_path: str) -> bool:
+        """检测登录状态，未登录时等待用户手动登录并保存 Session，返回是否确认已登录"""
+        # --- Smart Login Check ---
+        # 检查是否已登录 (通过查找正向特征：头像、Google Account 元素)
+        is_logged_in = False
+        try:
+            debug_logger.log_info("[BrowserCaptcha] 正在检查登录状态 (Positive Check)...")
+            # 给一点时间渲染
+            await asyncio.sleep(5)
+            
+            # 正向检测：查找明确表示已登录的元素
+            # 1. 查找 aria-label 包含 "Google Account" 或 "Google 帐号" 的元素 (通常是头像按钮)
+            # 2. 查找 img 元素作为头像
+            login_indicator = await page.query_selector('button[aria-label*="Google Account"], button[aria-label*="Google 帐号"], img[src*="googleusercontent.com"]')
+            
+            if login_indicator:
+                 debug_logger.log_info("[BrowserCaptcha] 发现登录特征元素: %s", login_indicator)
+                 is_logged_in = True
+            else:
+                 # 二次检查页面内容，防止 selector 漏掉
+                 # 只有同时满足 "没有Sign in" 且 "有特定的 Dashboard 关键词" 才敢认为是登录
+                 # 这里为了稳妥，如果找不到头像，就默认认为未登录，强制让用户确认
+                 debug_logger.log_info("[BrowserCaptcha] 未发现明确登录特征 (头像等)，将请求用户介入")
+                 is_logged_in = False
+                 
+        except Exception as e:
+            debug_logger.log_warning("[BrowserCaptcha] 登录检测异常: %s", e)
+            is_logged_in = False
+
+        if is_logged_in:
+            debug_logger.log_info("[BrowserCaptcha] 检测到已登录状态，跳过手动登录等待。")
+            print("\n✅ 检测到已登录，继续执行...")
+            # 即使已登录，也可以顺手更新一下 auth.json (以防 cookie 包含新的字段，未变化时不写盘)
+            self._schedule_state_save(context, auth_path, token_id)
+
+        else:
+            # --- Unlogged State: Force Manual Login ---
+            print("\n" + "="*50)
+            print("!!! 未检测到登录状态 !!!")
+            print("请在 300秒 (5分钟) 内完成以下操作：")
+            print("1. 点击右上角 'Sign in' 登录你的 Google 账号")
+            print("2. 确保页面显示你的头像 (已登录状态)")
+            print("3. 程序会自动保存你的登录状态到 auth.json")
+            print("="*50 + "\n")
+            
+            # 等待登录完成：页面出现头像/登出链接，或 Auth Cookie 写入（事件驱动，不再每秒轮询）
+            is_logged_in = await self._wait_for_manual_login(page, timeout=300)
+
+            if is_logged_in:
+                print("\n✅ 检测到登录成功 (UI/Cookie)，继续...")
+                # 登录成功后只保存一次（后台写盘）
+                self._schedule_state_save(context, auth_path, token_id)
+            else:
+                print("⚠️ 等待登录超时，继续尝试执行...")
+        return is_logged_in
+
+    async def _wait_for_manual_login(self, page: Page, timeout: float) -> bool:
+        """等待用户完成登录（UI特征或Auth Cookie任一出现即返回），超时返回False"""
+        ui_wait = asyncio.ensure_future(page.wait_for_selector(
+            'img[src*="googleusercontent.com"], a[href*="accounts.google.com/SignOut"]',
+            timeout=timeout * 1000
+        ))
+        cookie_wait = asyncio.ensure_future(wait_for_cookies(page, _AUTH_COOKIE_NAMES, timeout=timeout, require_all=False))
+        pending = {ui_wait, cookie_wait}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        return True
+            return False
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _schedule_state_save(self, context: BrowserContext, auth_path: str, token_id: Optional[int]):
+        """标记 Session 待保存，由后台任务写盘"""
+        self._dirty_states[auth_path] = (context, token_id)
+        self._dirty_event.set()
+
+    async def _flush_loop(self):
+        """后台合并保存 Session：收到保存请求后稍等片刻，一次写入期间累积的全部账号"""
+        while True:
+            await self._dirty_event.wait()
+            await asyncio.sleep(STATE_FLUSH_DELAY_SECONDS)
+            self._dirty_event.clear()
+            await self._flush_states()
+
+    async def _flush_states(self):
+        """写入所有待保存的 Session"""
+        pending, self._dirty_states = self._dirty_states, {}
+        if not pending:
+            return
+        from .session_manager import get_session_manager
+        session_mgr = get_session_manager()
+        for auth_path, (context, token_id) in pending.items():
+            try:
+                if await save_storage_state(context, auth_path):
+                    print(f"✅ 登录状态已保存到 {auth_path}")
+                if token_id:
+                    session_mgr.mark_session_saved(token_id)
+            except Exception as e:
+                print(f"❌ 保存登录状态失败: {e}")
 
     async def close(self):
         """关闭浏览器"""
         try:
-            if self.browser:
+            # 停止后台保存任务，并在关闭上下文前写入剩余的 Session
+            if self._flush_task:
+                self._flush_task.cancel()
+                await asyncio.gather(self._flush_task, return_exceptions=True)
+                self._flush_task = None
+            await self._flush_states()
+
+            contexts = [context for context, _ in self._contexts.values()]
+            contexts.extend(self._retired_contexts)
+            for context in contexts:
+                await self._close_context(context)
+            self._contexts.clear()
+            self._retired_contexts.clear()
+            self._context_users.clear()
+            self._pages.clear()
+
+            if self.browser and self._owns_browser:
                 try:
                     await self.browser.close()
                 except Exception as e:
                     # 忽略连接关闭错误（正常关闭场景）
                     if "Connection closed" not in str(e):
-                        debug_logger.log_warning(f"[BrowserCaptcha] 关闭浏览器时出现异常: {str(e)}")
-                finally:
-                    self.browser = None
+                        debug_logger.log_warning("[BrowserCaptcha] 关闭浏览器时出现异常: %s", e)
+            self.browser = None
+            self._owns_browser = False
 
-            if self.playwright:
-                try:
-                    await self.playwright.stop()
-                except Exception:
-                    pass  # 静默处理 playwright 停止异常
-                finally:
-                    self.playwright = None
+            # 共享的 Playwright 驱动由 browser_pool.close_browser() 在退出时停止
+            self.playwright = None
 
             self._initialized = False
             debug_logger.log_info("[BrowserCaptcha] 浏览器已关闭")
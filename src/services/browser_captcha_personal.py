@@ -2,25 +2,92 @@ import asyncio
 import time
 import re
 import os
-from typing import Optional, Dict
-from playwright.async_api import async_playwright, BrowserContext, Page
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Dict, Tuple
+from playwright.async_api import BrowserContext, Page, TimeoutError as PlaywrightTimeoutError
 
 from ..core.logger import debug_logger
+from .browser_pool import LEAN_ARGS, get_playwright, spawn_browser_task
+
+# 同时保持打开的账号窗口上限（每个持久化上下文是一个独立的浏览器进程）
+MAX_PERSISTENT_CONTEXTS = 5
+# 已加载项目页面的复用时长，到期后关闭并重新访问
+PAGE_MAX_AGE_SECONDS = 600
+# 每个 (账号, 项目) 最多保留的空闲页面数，以及所有项目合计的上限
+PAGE_POOL_SIZE = 4
+MAX_POOLED_PAGES = 16
+
+# 以上下文 init script 安装到每个页面的取 token 函数，打码时只需调用它
+_TOKEN_FN_JS = """
+window.__getRecaptchaToken = async () => {
+    try {
+        return await window.grecaptcha.execute('__WEBSITE_KEY__', { action: 'FLOW_GENERATION' });
+    } catch (e) { return null; }
+};
+"""
+
+# 页面未自带 grecaptcha 时注入脚本（仍在解析中则等 DOMContentLoaded 后注入），脚本地址作为参数传入
+_INJECT_RECAPTCHA_JS = """
+(url) => {
+    const inject = () => {
+        if (window.grecaptcha && window.grecaptcha.execute) return;
+        const script = document.createElement('script');
+        script.src = url;
+        script.async = true; script.defer = true;
+        document.head.appendChild(script);
+    };
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', inject, { once: true });
+    } else {
+        inject();
+    }
+}
+"""
+
+# grecaptcha.execute 可用即视为就绪
+_GRECAPTCHA_READY_JS = "() => !!(window.grecaptcha && typeof window.grecaptcha.execute === 'function')"
+
+# 打码页面只需要文档、页面脚本和 reCAPTCHA 本身，其余资源在网络层丢弃
+_BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media", "stylesheet"})
+_ALLOWED_HOSTS = ("google.com/recaptcha", "gstatic.com/recaptcha", "labs.google")
+
+
+async def _captcha_route(route):
+    """打码页面的请求过滤：丢弃静态资源和第三方请求（统计等）"""
+    request = route.request
+    if request.resource_type in _BLOCKED_RESOURCE_TYPES:
+        return await route.abort()
+    if any(host in request.url for host in _ALLOWED_HOSTS):
+        return await route.continue_()
+    if request.resource_type in ("xhr", "fetch", "websocket", "other"):
+        return await route.abort()
+    await route.continue_()
+
+# 代理URL格式: protocol://[username:password@]host:port
+_PROXY_RE = re.compile(r'^(socks5|http|https)://(?:([^:]+):([^@]+)@)?([^:]+):(\d+)$')
+
 
-# ... (保持原来的 parse_proxy_url 和 validate_browser_proxy_url 函数不变) ...
 def parse_proxy_url(proxy_url: str) -> Optional[Dict[str, str]]:
     """解析代理URL，分离协议、主机、端口、认证信息"""
-    proxy_pattern = r'^(socks5|http|https)://(?:([^:]+):([^@]+)@)?([^:]+):(\d+)$'
-    match = re.match(proxy_pattern, proxy_url)
+    items = _parse_proxy_items(proxy_url)
+    # 每次返回新的 dict，调用方修改不会污染缓存
+    return dict(items) if items is not None else None
+
+@lru_cache(maxsize=16)
+def _parse_proxy_items(proxy_url: str) -> Optional[Tuple[Tuple[str, str], ...]]:
+    """parse_proxy_url 的缓存部分（代理URL很少变化）"""
+    match = _PROXY_RE.match(proxy_url)
     if match:
         protocol, username, password, host, port = match.groups()
         proxy_config = {'server': f'{protocol}://{host}:{port}'}
         if username and password:
             proxy_config['username'] = username
             proxy_config['password'] = password
-        return proxy_config
+        return tuple(proxy_config.items())
     return None
 
+@lru_cache(maxsize=128)
 def validate_browser_proxy_url(proxy_url: str) -> tuple[bool, str]:
     """验证浏览器代理URL格式"""
     if not proxy_url:
@@ -41,14 +108,30 @@ class BrowserCaptchaService:
         self.headless = False 
         self.playwright = None
         # 注意: 持久化模式下，我们操作的是 context 而不是 browser
-        self.context: Optional[BrowserContext] = None 
-        self._initialized = False
+        # 每个账号一个持久化上下文 (token_id -> context)，按最近使用顺序排列
+        self._contexts: "OrderedDict[Optional[int], BrowserContext]" = OrderedDict()
+        self._context_lock = asyncio.Lock()
+        # 上下文 -> 正在使用它打码的请求数；被挤出 LRU 时仍在使用的上下文延迟到最后一个请求结束再关闭
+        self._context_users: Dict[BrowserContext, int] = {}
+        self._retired_contexts: set = set()
+        # 限制同时打码的页面数（同一上下文可并行驱动多个页面），按配置创建，配置变更时重建
+        self._page_sem: Optional[asyncio.Semaphore] = None
+        self._page_sem_limit = 0
+        # token_id -> 用户数据目录，首次使用时计算
+        self._data_dirs: Dict[Optional[int], str] = {}
+        # (token_id, project_id) -> 空闲页面池 [(已加载 reCAPTCHA 的页面, 加载时间)]，按最近使用顺序排列
+        # 每个请求独占取出一个页面，用完放回，重复打码直接 execute
+        self._page_pool: "OrderedDict[Tuple[Optional[int], str], asyncio.Queue]" = OrderedDict()
+        # 池中无页面时正在加载的项目页面：同一项目的并发请求共用一次页面访问，各自 execute 取 token
+        # （v3 token 只能校验一次，因此只合并页面加载，不缓存/共享 token）
+        self._page_inflight: Dict[Tuple[Optional[int], str], asyncio.Task] = {}
+        # 共用加载页面 -> [使用者数, 是否有使用者取到 token]，最后一个使用者决定放回池中还是关闭
+        self._page_users: Dict[Page, list] = {}
         self.website_key = "6LdsFiUsAAAAAIjVDZcuLhaHiDn5nnHVXVRQGeMV"
+        # 与 website_key 相关的脚本/地址只构造一次
+        self._recaptcha_url = f"https://www.google.com/recaptcha/api.js?render={self.website_key}"
+        self._token_fn_js = _TOKEN_FN_JS.replace("__WEBSITE_KEY__", self.website_key)
         self.db = db
-        
-        # === 修改点 2: 指定本地数据存储目录 ===
-        # 这会在脚本运行目录下生成 browser_data 文件夹，用于保存你的登录状态
-        self.user_data_dir = os.path.join(os.getcwd(), "browser_data")
 
     @classmethod
     async def get_instance(cls, db=None) -> 'BrowserCaptchaService':
@@ -59,122 +142,249 @@ class BrowserCaptchaService:
                     # 首次调用不强制初始化，等待 get_token 时懒加载，或者可以在这里await
         return cls._instance
 
+    def _user_data_dir(self, token_id: Optional[int]) -> str:
+        """账号对应的本地数据目录，用于保存该账号的登录状态"""
+        path = self._data_dirs.get(token_id)
+        if path is None:
+            # === 修改点 2: 指定本地数据存储目录 ===
+            name = f"browser_data_{token_id}" if token_id else "browser_data"
+            path = self._data_dirs[token_id] = os.path.join(os.getcwd(), name)
+        return path
+
     async def initialize(self):
-        """初始化持久化浏览器上下文"""
-        if self._initialized and self.context:
+        """初始化默认账号的持久化浏览器上下文"""
+        await self._get_context(None)
+
+    async def _get_context(self, token_id: Optional[int]) -> BrowserContext:
+        """获取账号的持久化上下文，不存在时启动；超过上限时关闭最久未使用的"""
+        context = self._contexts.get(token_id)
+        if context is not None:
+            self._contexts.move_to_end(token_id)
+            return context
+
+        async with self._context_lock:
+            context = self._contexts.get(token_id)
+            if context is not None:
+                self._contexts.move_to_end(token_id)
+                return context
+
+            context = await self._launch_ctx(token_id)
+            self._contexts[token_id] = context
+
+            while len(self._contexts) > MAX_PERSISTENT_CONTEXTS:
+                old_token_id, old_context = self._contexts.popitem(last=False)
+                if self._context_users.get(old_context):
+                    debug_logger.log_info("[BrowserCaptcha] 最久未使用的账号窗口仍在打码，结束后关闭: %s", self._user_data_dir(old_token_id))
+                    self._retired_contexts.add(old_context)
+                    continue
+                debug_logger.log_info("[BrowserCaptcha] 关闭最久未使用的账号窗口: %s", self._user_data_dir(old_token_id))
+                await self._close_context(old_context)
+            return context
+
+    async def _acquire_context(self, token_id: Optional[int]) -> BrowserContext:
+        """获取账号上下文并登记一次使用，用完必须调用 _release_context"""
+        context = await self._get_context(token_id)
+        self._context_users[context] = self._context_users.get(context, 0) + 1
+        return context
+
+    async def _release_context(self, context: BrowserContext):
+        """结束一次使用；已被挤出 LRU 的上下文在最后一个使用者结束时关闭"""
+        users = self._context_users.get(context, 0) - 1
+        if users > 0:
+            self._context_users[context] = users
             return
+        self._context_users.pop(context, None)
+        if context in self._retired_contexts:
+            self._retired_contexts.discard(context)
+            await self._close_context(context)
+
+    @staticmethod
+    async def _close_context(context: BrowserContext):
+        """关闭上下文（整个账号窗口），失败只记录日志"""
+        try:
+            await context.close()
+        except Exception as e:
+            debug_logger.log_warning("[BrowserCaptcha] 关闭账号窗口异常: %s", e)
 
+    async def _launch_ctx(self, token_id: Optional[int]) -> BrowserContext:
+        """启动账号的持久化浏览器上下文"""
+        user_data_dir = self._user_data_dir(token_id)
         try:
-            proxy_url = None
-            if self.db:
-                captcha_config = await self.db.get_captcha_config()
-                if captcha_config.browser_proxy_enabled and captcha_config.browser_proxy_url:
-                    proxy_url = captcha_config.browser_proxy_url
+            proxy_config = await self._get_proxy_config()
 
-            debug_logger.log_info(f"[BrowserCaptcha] 正在启动浏览器 (用户数据目录: {self.user_data_dir})...")
-            self.playwright = await async_playwright().start()
+            debug_logger.log_info("[BrowserCaptcha] 正在启动浏览器 (用户数据目录: %s)...", user_data_dir)
+            if self.playwright is None:
+                # 与 browser_pool 共用同一个 Playwright 驱动进程
+                self.playwright = await get_playwright()
 
             # 配置启动参数
             launch_options = {
                 'headless': self.headless,
-                'user_data_dir': self.user_data_dir, # 指定数据目录
+                'user_data_dir': user_data_dir, # 指定数据目录
                 'viewport': {'width': 1280, 'height': 720}, # 设置默认窗口大小
                 'args': [
                     '--disable-blink-features=AutomationControlled',
                     '--disable-infobars',
                     '--no-sandbox',
                     '--disable-setuid-sandbox',
+                    '--window-size=1280,720',
+                    *LEAN_ARGS,
+                    # HTTP 缓存放在 profile 目录内，reCAPTCHA 静态资源跨重启命中磁盘缓存
+                    # （需持久化 browser_data* 目录，见 docker-compose.yml 的挂载）
+                    '--disk-cache-size=104857600',
+                    '--media-cache-size=33554432',
                 ]
             }
 
             # 代理配置
-            if proxy_url:
-                proxy_config = parse_proxy_url(proxy_url)
-                if proxy_config:
-                    launch_options['proxy'] = proxy_config
-                    debug_logger.log_info(f"[BrowserCaptcha] 使用代理: {proxy_config['server']}")
+            if proxy_config:
+                launch_options['proxy'] = dict(proxy_config)
+                debug_logger.log_info("[BrowserCaptcha] 使用代理: %s", proxy_config['server'])
 
             # === 修改点 3: 使用 launch_persistent_context ===
             # 这会启动一个带有状态的浏览器窗口
-            self.context = await self.playwright.chromium.launch_persistent_context(**launch_options)
+            context = await self.playwright.chromium.launch_persistent_context(**launch_options)
             
             # 设置默认超时
-            self.context.set_default_timeout(30000)
+            context.set_default_timeout(30000)
+            # 取 token 函数随每个页面加载，不必每次打码都下发整段脚本
+            await context.add_init_script(script=self._token_fn_js)
+            # 窗口被手动关闭时移出缓存，下次自动重新启动
+            context.on("close", lambda _: self._evict_context(token_id, context))
+            # 后台预热 reCAPTCHA 资源缓存，不阻塞本次启动
+            spawn_browser_task(self._warm_up_cache(context), name=f"captcha-warmup-{token_id}")
 
-            self._initialized = True
-            debug_logger.log_info(f"[BrowserCaptcha] ✅ 浏览器已启动 (Profile: {self.user_data_dir})")
+            debug_logger.log_info("[BrowserCaptcha] ✅ 浏览器已启动 (Profile: %s)", user_data_dir)
+            return context
             
         except Exception as e:
             debug_logger.log_error(f"[BrowserCaptcha] ❌ 浏览器启动失败: {str(e)}")
             raise
 
+    async def _get_proxy_config(self) -> Optional[Dict[str, str]]:
+        """获取浏览器代理配置（None 表示不使用代理）"""
+        if self.db:
+            captcha_config = await self.db.get_captcha_config()
+            if captcha_config.browser_proxy_enabled and captcha_config.browser_proxy_url:
+                return parse_proxy_url(captcha_config.browser_proxy_url)
+        return None
+
+    async def _warm_up_cache(self, context: BrowserContext):
+        """后台在 labs.google 页面上完整加载一次 reCAPTCHA，使其脚本和资源进入该 profile 的 HTTP 缓存"""
+        page = await context.new_page()
+        try:
+            await page.route("**/*", _captcha_route)
+            await page.goto("https://labs.google/fx/tools/flow", wait_until="domcontentloaded", timeout=20000)
+            await page.evaluate(_INJECT_RECAPTCHA_JS, self._recaptcha_url)
+            await page.wait_for_function(_GRECAPTCHA_READY_JS, timeout=15000)
+        except Exception as e:
+            debug_logger.log_warning("[BrowserCaptcha] reCAPTCHA 缓存预热失败: %s", e)
+        finally:
+            await self._close_page(page)
+
+    def _evict_context(self, token_id: Optional[int], context: BrowserContext):
+        """上下文被关闭时移出缓存"""
+        if self._contexts.get(token_id) is context:
+            self._contexts.pop(token_id, None)
+        self._retired_contexts.discard(context)
+
+    async def _checkout_page(self, key: Tuple[Optional[int], str]) -> Optional[Tuple[Page, float]]:
+        """从池中取出一个可用页面，没有时返回None（已关闭或已到期的页面直接丢弃）"""
+        queue = self._page_pool.get(key)
+        while queue is not None and not queue.empty():
+            page, loaded_at = queue.get_nowait()
+            if not page.is_closed() and time.monotonic() - loaded_at < PAGE_MAX_AGE_SECONDS:
+                self._page_pool.move_to_end(key)
+                return page, loaded_at
+            await self._close_page(page)
+        return None
+
+    async def _return_page(self, key: Tuple[Optional[int], str], page: Page, loaded_at: float):
+        """页面用完放回池中；池已满时关闭，合计超过上限时关闭最久未使用项目的页面"""
+        if page.is_closed():
+            return
+        queue = self._page_pool.get(key)
+        if queue is None:
+            queue = self._page_pool[key] = asyncio.Queue(maxsize=PAGE_POOL_SIZE)
+        self._page_pool.move_to_end(key)
+        if queue.full():
+            await self._close_page(page)
+            return
+        queue.put_nowait((page, loaded_at))
+
+        total = sum(q.qsize() for q in self._page_pool.values())
+        while total > MAX_POOLED_PAGES:
+            old_key, old_queue = next(iter(self._page_pool.items()))
+            if old_queue.empty():
+                self._page_pool.pop(old_key)
+                continue
+            old_page, _ = old_queue.get_nowait()
+            await self._close_page(old_page)
+            total -= 1
+
+    @staticmethod
+    async def _close_page(page: Page):
+        """关闭页面（不执行 beforeunload），失败只记录日志"""
+        try:
+            await page.close(run_before_unload=False)
+        except Exception as e:
+            debug_logger.log_warning("[BrowserCaptcha] 关闭页面异常: %s", e)
+
+    async def _get_page_semaphore(self) -> asyncio.Semaphore:
+        """获取打码并发信号量（上限取 captcha_config.browser_max_concurrency，变更后重建）"""
+        limit = 4
+        if self.db:
+            captcha_config = await self.db.get_captcha_config()
+            limit = captcha_config.browser_max_concurrency
+        limit = max(1, limit)
+        if self._page_sem is None or limit != self._page_sem_limit:
+            # 进行中的请求仍在旧信号量上释放，新请求按新上限排队
+            self._page_sem = asyncio.Semaphore(limit)
+            self._page_sem_limit = limit
+        return self._page_sem
+
     async def get_token(self, project_id: str, token_id: Optional[int] = None) -> Optional[str]:
         """获取 reCAPTCHA token"""
-        target_dir = os.path.join(os.getcwd(), f"browser_data_{token_id}") if token_id else os.path.join(os.getcwd(), "browser_data")
-        
-        # 如果浏览器使用的目录与目标目录不一致，或者未初始化，则重新初始化
-        if (self._initialized and self.user_data_dir != target_dir) or (not self._initialized):
-            if self._initialized:
-                debug_logger.log_info(f"[BrowserCaptcha] 切换账号: {self.user_data_dir} -> {target_dir}")
-                await self.close()
-            
-            self.user_data_dir = target_dir
-            await self.initialize()
-
-        # 确保浏览器已启动
-        if not self._initialized or not self.context:
-            await self.initialize()
+        # 每个账号复用自己的持久化上下文，切换账号不再关闭重启浏览器
+        context = await self._acquire_context(token_id)
+        try:
+            # 多个打码请求在同一上下文中并行使用各自的页面，超出上限的排队
+            async with await self._get_page_semaphore():
+                return await self._fetch_token(context, project_id, token_id)
+        finally:
+            await self._release_context(context)
 
-        start_time = time.time()
+    async def _fetch_token(self, context: BrowserContext, project_id: str, token_id: Optional[int]) -> Optional[str]:
+        """在已占用并发名额的情况下执行一次打码"""
         page: Optional[Page] = None
+        key = (token_id, project_id)
+        ok = False
 
         try:
-            # === 修改点 4: 在现有上下文中新建标签页，而不是新建上下文 ===
-            # 这样可以复用该上下文中已保存的 Cookie (你的登录状态)
-            page = await self.context.new_page()
+            # 同一项目已加载过 reCAPTCHA 的页面直接复用，省去新建标签页和页面访问
+            pooled = await self._checkout_page(key)
+            if pooled:
+                page, loaded_at = pooled
+                debug_logger.log_info("[BrowserCaptcha] 复用已加载的项目页面: %s", project_id)
+            else:
+                task = self._page_inflight.get(key)
+                if task is None:
+                    task = asyncio.ensure_future(self._load_page(context, project_id))
+                    self._page_inflight[key] = task
+                    task.add_done_callback(lambda t: self._page_inflight.pop(key, None) if self._page_inflight.get(key) is t else None)
+                else:
+                    debug_logger.log_info("[BrowserCaptcha] 等待同一项目的页面加载完成: %s", project_id)
+                # shield: 单个请求被取消时，加载继续完成供其他请求使用
+                page, loaded_at = await asyncio.shield(task)
+            state = self._page_users.setdefault(page, [0, False])
+            state[0] += 1
 
-            website_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
-            debug_logger.log_info(f"[BrowserCaptcha] 访问页面: {website_url}")
+            # 执行获取 Token（调用 init script 安装的函数）
+            token = await page.evaluate("() => window.__getRecaptchaToken()")
 
-            # 访问页面
-            try:
-                await page.goto(website_url, wait_until="domcontentloaded")
-            except Exception as e:
-                debug_logger.log_warning(f"[BrowserCaptcha] 页面加载警告: {str(e)}")
-
-            # --- 关键点：如果需要人工介入 ---
-            # 你可以在这里加入一段逻辑，如果是第一次运行，或者检测到未登录，
-            # 可以暂停脚本，等你手动操作完再继续。
-            # 例如: await asyncio.sleep(30) 
-            
-            # ... (中间注入脚本和执行 reCAPTCHA 的代码逻辑与原版完全一致，此处省略以节省篇幅) ...
-            # ... 请将原代码中从 "检查并注入 reCAPTCHA v3 脚本" 到 token 获取部分的代码复制到这里 ...
-            
-            # 这里为了演示，简写注入逻辑（请保留你原有的完整注入逻辑）:
-            script_loaded = await page.evaluate("() => { return !!(window.grecaptcha && window.grecaptcha.execute); }")
-            if not script_loaded:
-                await page.evaluate(f"""
-                    () => {{
-                        const script = document.createElement('script');
-                        script.src = 'https://www.google.com/recaptcha/api.js?render={self.website_key}';
-                        script.async = true; script.defer = true;
-                        document.head.appendChild(script);
-                    }}
-                """)
-                # 等待加载... (保留你原有的等待循环)
-                await page.wait_for_timeout(2000) 
-
-            # 执行获取 Token (保留你原有的 execute 逻辑)
-            token = await page.evaluate(f"""
-                async () => {{
-                    try {{
-                        return await window.grecaptcha.execute('{self.website_key}', {{ action: 'FLOW_GENERATION' }});
-                    }} catch (e) {{ return null; }}
-                }}
-            """)
-            
             if token:
-                debug_logger.log_info(f"[BrowserCaptcha] ✅ Token获取成功")
+                debug_logger.log_info("[BrowserCaptcha] ✅ Token获取成功")
+                ok = True
                 return token
             else:
                 debug_logger.log_error("[BrowserCaptcha] Token获取失败")
@@ -184,25 +394,74 @@ class BrowserCaptchaService:
             debug_logger.log_error(f"[BrowserCaptcha] 异常: {str(e)}")
             return None
         finally:
-            # === 修改点 5: 只关闭 Page (标签页)，不关闭 Context (浏览器窗口) ===
             if page:
-                try:
-                    await page.close()
-                except:
-                    pass
+                await self._release_page(key, page, loaded_at, ok)
+
+    async def _load_page(self, context: BrowserContext, project_id: str) -> Tuple[Page, float]:
+        """新建标签页并加载项目页面，等待 reCAPTCHA 就绪（失败时关闭页面）"""
+        loaded_at = time.monotonic()
+        # === 修改点 4: 在现有上下文中新建标签页，而不是新建上下文 ===
+        # 这样可以复用该上下文中已保存的 Cookie (你的登录状态)
+        page = await context.new_page()
+        try:
+            # 过滤只作用于打码页面，登录窗口等其他页面正常加载
+            await page.route("**/*", _captcha_route)
+
+            website_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
+            debug_logger.log_info("[BrowserCaptcha] 访问页面: %s", website_url)
+
+            # 访问页面：导航提交即返回，脚本注入推迟到 DOM 就绪时由页面自己完成
+            try:
+                await page.goto(website_url, wait_until="commit", timeout=20000)
+            except Exception as e:
+                debug_logger.log_warning("[BrowserCaptcha] 页面加载警告: %s", e)
+
+            # 页面未自带 grecaptcha 时注入脚本（仍在解析中则等 DOMContentLoaded 后注入）
+            await page.evaluate(_INJECT_RECAPTCHA_JS, self._recaptcha_url)
+            # 等待加载：由浏览器端判断 grecaptcha 就绪后返回，不再固定等待
+            try:
+                await page.wait_for_function(_GRECAPTCHA_READY_JS, timeout=10000)
+            except PlaywrightTimeoutError:
+                debug_logger.log_warning("[BrowserCaptcha] reCAPTCHA 初始化超时，继续尝试执行...")
+        except BaseException:
+            await self._close_page(page)
+            raise
+        return page, loaded_at
+
+    async def _release_page(self, key: Tuple[Optional[int], str], page: Page, loaded_at: float, ok: bool):
+        """结束一次页面使用；最后一个使用者在有人取到 token 时放回池中，否则关闭"""
+        state = self._page_users.get(page)
+        if state is None:
+            # close() 已清空登记时按失败处理
+            state = [1, False]
+        state[0] -= 1
+        state[1] = state[1] or ok
+        if state[0] > 0:
+            return
+        self._page_users.pop(page, None)
+        # === 修改点 5: 只关闭未放回池中的 Page (标签页)，不关闭 Context (浏览器窗口) ===
+        if state[1]:
+            await self._return_page(key, page, loaded_at)
+        else:
+            await self._close_page(page)
 
     async def close(self):
         """完全关闭浏览器（清理资源时调用）"""
         try:
-            if self.context:
-                await self.context.close() # 这会关闭整个浏览器窗口
-                self.context = None
+            contexts = [*self._contexts.values(), *self._retired_contexts]
+            self._contexts.clear()
+            self._retired_contexts.clear()
+            self._context_users.clear()
+            # 页面随上下文一起关闭
+            self._page_pool.clear()
+            self._page_inflight.clear()
+            self._page_users.clear()
+            for context in contexts:
+                await self._close_context(context) # 这会关闭整个浏览器窗口
+            
+            # 共享的 Playwright 驱动由 browser_pool.close_browser() 在退出时停止
+            self.playwright = None
             
-            if self.playwright:
-                await self.playwright.stop()
-                self.playwright = None
-                
-            self._initialized = False
             debug_logger.log_info("[BrowserCaptcha] 浏览器服务已关闭")
         except Exception as e:
             debug_logger.log_error(f"[BrowserCaptcha] 关闭异常: {str(e)}")
@@ -210,10 +469,10 @@ class BrowserCaptchaService:
     # 增加一个辅助方法，用于手动登录
     async def open_login_window(self):
         """调用此方法打开一个永久窗口供你登录Google"""
-        await self.initialize()
-        page = await self.context.new_page()
+        context = await self._get_context(None)
+        page = await context.new_page()
         try:
             await page.goto("https://accounts.google.com/")
         except Exception as e:
-            debug_logger.log_warning(f"[BrowserCaptcha] login page open failed: {str(e)}")
-        print("请在打开的浏览器中登录账号。登录完成后，无需关闭浏览器，脚本下次运行时会自动使用此状态。")
\ No newline at end of file
+            debug_logger.log_warning("[BrowserCaptcha] login page open failed: %s", e)
+        debug_logger.log_info("[BrowserCaptcha] 请在打开的浏览器中登录账号。登录完成后，无需关闭浏览器，脚本下次运行时会自动使用此状态。")
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""Shared Playwright driver and browser for session login / ST refresh / captcha
+
+Starting Playwright and launching Chromium costs seconds and hundreds of MB,
+so the driver and browser are started once (lazily) and every task gets its
+own BrowserContext, which is cheap and fully isolated (cookies / storage).
+The captcha services reuse the same driver process.
+"""
+import asyncio
+import hashlib
+import os
+import orjson
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext, Page
+
+from ..core.logger import debug_logger
+
+# Cut background work (sync, translate, component updates...) that competes with login / captcha traffic.
+# Site isolation is deliberately left on (no IsolateOrigins / site-per-process): disabling it hurts reCAPTCHA scoring.
+LEAN_ARGS = (
+    '--disable-background-networking',
+    '--disable-default-apps',
+    '--disable-extensions',
+    '--disable-sync',
+    '--no-first-run',
+    '--disable-translate',
+    '--disable-features=Translate,MediaRouter,OptimizationHints,InterestFeedContentSuggestions',
+    '--mute-audio',
+)
+
+LAUNCH_ARGS = (
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--no-sandbox',
+    *LEAN_ARGS,
+)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+
+_playwright: Optional[Playwright] = None
+_browser: Optional[Browser] = None
+_lock = asyncio.Lock()
+
+
+async def get_playwright() -> Playwright:
+    """Get the shared Playwright driver, starting it on first use"""
+    global _playwright
+
+    if _playwright is None:
+        async with _lock:
+            if _playwright is None:
+                _playwright = await async_playwright().start()
+    return _playwright
+
+
+async def get_browser() -> Browser:
+    """Get the shared browser, launching it on first use (or after it was closed)"""
+    global _playwright, _browser
+
+    if _browser is not None and _browser.is_connected():
+        return _browser
+
+    async with _lock:
+        if _browser is not None and _browser.is_connected():
+            return _browser
+
+        if _playwright is None:
+            _playwright = await async_playwright().start()
+
+        _browser = await _playwright.chromium.launch(
+            headless=False,  # 有头模式，便于用户完成登录/OAuth
+            args=list(LAUNCH_ARGS)
+        )
+        debug_logger.log_info("[BrowserPool] 共享浏览器已启动")
+        return _browser
+
+
+async def new_context(storage_state: Optional[str] = None) -> BrowserContext:
+    """Open an isolated context on the shared browser (optionally loading a saved session)"""
+    browser = await get_browser()
+    return await browser.new_context(user_agent=USER_AGENT, storage_state=storage_state)
+
+
+async def close_browser():
+    """Close the shared browser and stop Playwright (called on shutdown)"""
+    global _playwright, _browser
+
+    async with _lock:
+        if _browser is not None:
+            try:
+                await _browser.close()
+            except Exception as e:
+                debug_logger.log_warning("[BrowserPool] 关闭浏览器异常: %s", e)
+            _browser = None
+
+        if _playwright is not None:
+            try:
+                await _playwright.stop()
+            except Exception as e:
+                debug_logger.log_warning("[BrowserPool] 停止Playwright异常: %s", e)
+            _playwright = None
+
+
+# ========== Cookie waits ==========
+
+# Only these responses can carry the Set-Cookie we are waiting for (skip images / scripts / fonts)
+_COOKIE_RESOURCE_TYPES = frozenset({"document", "xhr", "fetch"})
+
+
+async def wait_for_cookies(
+    page: Page,
+    names: Iterable[str],
+    timeout: float,
+    urls: Optional[List[str]] = None,
+    require_all: bool = True
+) -> Optional[Dict[str, str]]:
+    """Wait until all named cookies (or any of them, with require_all=False) exist in the page's context
+
+    Cookies are re-checked when a document / XHR response arrives instead of on a
+    fixed timer, so the wait ends as soon as login completes. Returns
+    {name: value} of the wanted cookies found, or None on timeout or when the
+    page is closed.
+    """
+    context = page.context
+    wanted = frozenset(names)
+    poke = asyncio.Event()
+    closed = False
+
+    def on_response(response):
+        if response.request.resource_type in _COOKIE_RESOURCE_TYPES:
+            poke.set()
+
+    def on_close(_):
+        nonlocal closed
+        closed = True
+        poke.set()
+
+    async def watch() -> Optional[Dict[str, str]]:
+        while True:
+            await poke.wait()
+            poke.clear()
+            if closed:
+                return None
+            cookies = await (context.cookies(urls) if urls else context.cookies())
+            # One pass over the jar, then a set check for all required names
+            by_name = {c['name']: c['value'] for c in cookies}
+            if wanted <= by_name.keys() if require_all else not wanted.isdisjoint(by_name):
+                return {name: by_name[name] for name in wanted if name in by_name}
+
+    context.on("response", on_response)
+    page.on("close", on_close)
+    poke.set()  # Already logged in -> return immediately
+    try:
+        return await asyncio.wait_for(watch(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        context.remove_listener("response", on_response)
+        page.remove_listener("close", on_close)
+
+
+# ========== Storage state ==========
+
+# Only cookies / localStorage of these sites are needed to restore a Flow session
+_STATE_DOMAINS = ("google.com", "labs.google", "gstatic.com")
+# path -> digest of the state last written (or found) there, to skip unchanged saves without any I/O
+_last_state_hash: Dict[str, bytes] = {}
+
+
+def _is_state_domain(host: str) -> bool:
+    host = host.lstrip(".")
+    return any(host == domain or host.endswith("." + domain) for domain in _STATE_DOMAINS)
+
+
+def _filter_state(state: dict) -> dict:
+    """Drop cookies and origins that are unrelated to Google / Flow"""
+    return {
+        "cookies": [c for c in state.get("cookies", []) if _is_state_domain(c.get("domain", ""))],
+        "origins": [o for o in state.get("origins", []) if _is_state_domain(urlsplit(o.get("origin", "")).hostname or "")],
+    }
+
+
+async def save_storage_state(context: BrowserContext, path: str) -> bool:
+    """Persist the context's storage state to path, skipping the write when unchanged
+
+    Only Google / Flow cookies and origins are kept. A digest of the last saved
+    state is remembered per path, so repeated saves of an unchanged session
+    cost no disk I/O. The file is replaced atomically (tmp file + os.replace) so
+    a crash mid-write never leaves a truncated session behind. Returns True if
+    the file was written.
+    """
+    state = _filter_state(await context.storage_state())
+    data = orjson.dumps(state)
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    if _last_state_hash.get(path) == digest:
+        return False
+    # File I/O runs in a worker thread to keep the event loop responsive
+    written = await asyncio.to_thread(_write_state_if_changed, path, data)
+    _last_state_hash[path] = digest
+    return written
+
+
+def forget_storage_state(path: str):
+    """Forget the remembered digest for path (call when the file is deleted)"""
+    _last_state_hash.pop(path, None)
+
+
+def _write_state_if_changed(path: str, data: bytes) -> bool:
+    """Blocking part of save_storage_state"""
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+# ========== Background browser tasks ==========
+
+# Strong references to running tasks (the event loop only keeps weak refs)
+_tasks = set()
+# Token IDs with a running login / ST refresh task (they share one session file)
+_busy_tokens = set()
+
+
+def _on_task_done(task: asyncio.Task):
+    """Drop finished task and surface its failure instead of 'exception was never retrieved'"""
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Browser task {task.get_name()} failed: {task.exception()}")
+
+
+def spawn_browser_task(coro, name: Optional[str] = None) -> asyncio.Task:
+    """Schedule a browser task on the running loop (shares the browser above)"""
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
+
+
+def is_token_busy(token_id: int) -> bool:
+    """Whether a login / ST refresh task is already running for this token"""
+    return token_id in _busy_tokens
+
+
+def spawn_token_task(token_id: int, coro, name: Optional[str] = None) -> Optional[asyncio.Task]:
+    """Like spawn_browser_task, but at most one task per token
+
+    Returns None (and closes coro) if the token already has a task in flight.
+    """
+    if token_id in _busy_tokens:
+        coro.close()
+        return None
+    _busy_tokens.add(token_id)
+    task = spawn_browser_task(coro, name=name)
+    task.add_done_callback(lambda _: _busy_tokens.discard(token_id))
+    return task
+
+
+async def cancel_browser_tasks():
+    """Cancel still-running browser tasks so their contexts close before the browser does"""
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -17,6 +17,56 @@ class FlowClient:
         self.labs_base_url = config.flow_labs_base_url  # https://labs.google/fx/api
         self.api_base_url = config.flow_api_base_url    # https://aisandbox-pa.googleapis.com/v1
         self.timeout = config.flow_timeout
+        # 共享会话 (复用连接/TLS), 首次使用时在事件循环内创建
+        # 会话不保留 cookie: 账号凭据逐请求传入, 响应下发的 Set-Cookie 在请求结束后即清除, 避免账号串号
+        self._session: Optional[AsyncSession] = None
+
+    def _get_session(self) -> AsyncSession:
+        """Get the shared connection-pooled session (used for both ST and AT requests)"""
+        if self._session is None:
+            self._session = AsyncSession()
+        return self._session
+
+    async def close(self):
+        """Close the shared session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _send(
+        self,
+        session: AsyncSession,
+        method: str,
+        url: str,
+        headers: Dict,
+        json_data: Optional[Dict],
+        proxy_url: Optional[str],
+        cookies: Optional[Dict[str, str]] = None
+    ):
+        """Send a single request on the given session, without keeping any cookies it sets"""
+        try:
+            if method.upper() == "GET":
+                return await session.get(
+                    url,
+                    headers=headers,
+                    cookies=cookies,
+                    proxy=proxy_url,
+                    timeout=self.timeout,
+                    impersonate="chrome110"
+                )
+            # POST
+            return await session.post(
+                url,
+                headers=headers,
+                cookies=cookies,
+                json=json_data,
+                proxy=proxy_url,
+                timeout=self.timeout,
+                impersonate="chrome110"
+            )
+        finally:
+            # Responses (especially ST ones) set account cookies; drop them so the next request is clean
+            session.cookies.clear()
 
     async def _make_request(
         self,
@@ -46,9 +96,10 @@ class FlowClient:
         if headers is None:
             headers = {}
 
-        # ST认证 - 使用Cookie
+        # ST认证 - 使用Cookie (逐请求传入, 不进入共享会话的 cookie jar)
+        cookies = None
         if use_st and st_token:
-            headers["Cookie"] = f"__Secure-next-auth.session-token={st_token}"
+            cookies = {"__Secure-next-auth.session-token": st_token}
 
         # AT认证 - 使用Bearer
         if use_at and at_token:
@@ -73,38 +124,21 @@ class FlowClient:
         start_time = time.time()
 
         try:
-            async with AsyncSession() as session:
-                if method.upper() == "GET":
-                    response = await session.get(
-                        url,
-                        headers=headers,
-                        proxy=proxy_url,
-                        timeout=self.timeout,
-                        impersonate="chrome110"
-                    )
-                else:  # POST
-                    response = await session.post(
-                        url,
-                        headers=headers,
-                        json=json_data,
-                        proxy=proxy_url,
-                        timeout=self.timeout,
-                        impersonate="chrome110"
-                    )
-
-                duration_ms = (time.time() - start_time) * 1000
-
-                # Log response
-                if config.debug_enabled:
-                    debug_logger.log_response(
-                        status_code=response.status_code,
-                        headers=dict(response.headers),
-                        body=response.text,
-                        duration_ms=duration_ms
-                    )
-
-                response.raise_for_status()
-                return response.json()
+            response = await self._send(self._get_session(), method, url, headers, json_data, proxy_url, cookies)
+
+            duration_ms = (time.time() - start_time) * 1000
+
+            # Log response
+            if config.debug_enabled:
+                debug_logger.log_response(
+                    status_code=response.status_code,
+                    headers=dict(response.headers),
+                    body=response.text,
+                    duration_ms=duration_ms
+                )
+
+            response.raise_for_status()
+            return response.json()
 
         except Exception as e:
             duration_ms = (time.time() - start_time) * 1000
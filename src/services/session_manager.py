@@ -1,9 +1,12 @@
 """Session Manager for Flow2API - Per-Account Browser Session Management"""
+import asyncio
 import os
+import time
 import json
-from typing import Optional, Dict, List
-from datetime import datetime
+from typing import Optional, Dict, List, Set
 from ..core.logger import debug_logger
+from ..core.ttl_cache import TTLCache
+from .browser_pool import forget_storage_state
 
 
 class SessionManager:
@@ -14,14 +17,44 @@ class SessionManager:
     def __init__(self):
         """Initialize the session manager and ensure directory exists."""
         os.makedirs(self.SESSION_DIR, exist_ok=True)
+        # Token IDs with a session file, scanned at startup; kept in sync by mark_session_saved /
+        # delete_session and refreshed (on the event loop) by list_all_sessions_async
+        self._present = self._scan_sessions()
+        # token_id -> monotonic time of the last in-process save/delete, so a refresh never
+        # overrides a change made while its scan was running
+        self._changed_at: Dict[int, float] = {}
+        # Joined once; session paths are then a plain f-string
+        self._session_prefix = os.path.join(self.SESSION_DIR, "auth_")
+        # Short-lived status cache so bursts of UI polls cost one stat per token
+        self._status_cache = TTLCache(ttl=2.0)
+    
+    def _scan_sessions(self) -> Set[int]:
+        """Collect token IDs from auth_<id>.json files in SESSION_DIR."""
+        present = set()
+        with os.scandir(self.SESSION_DIR) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("auth_") and name.endswith(".json") and name[5:-5].isdigit():
+                    present.add(int(name[5:-5]))
+        return present
     
     def get_session_path(self, token_id: int) -> str:
         """Get the session file path for a given token ID."""
-        return os.path.join(self.SESSION_DIR, f"auth_{token_id}.json")
+        return f"{self._session_prefix}{token_id}.json"
     
     def has_session(self, token_id: int) -> bool:
-        """Check if a session file exists for the given token ID."""
-        return os.path.exists(self.get_session_path(token_id))
+        """Check if a session file exists for the given token ID (no filesystem access)."""
+        return token_id in self._present
+    
+    def mark_session_saved(self, token_id: int):
+        """Record that a session file was written for the given token ID."""
+        self._present.add(token_id)
+        self._changed_at[token_id] = time.monotonic()
+        self.invalidate(token_id)
+    
+    def invalidate(self, token_id: int):
+        """Drop the cached status of a token (after its session file changed)."""
+        self._status_cache.pop(token_id)
     
     def get_session_status(self, token_id: int) -> Dict:
         """
@@ -36,22 +69,31 @@ class SessionManager:
                 "message": str
             }
         """
+        cached = self._status_cache.get(token_id)
+        if cached is not None:
+            return dict(cached)  # Copy so callers cannot mutate the cached entry
+        
         session_path = self.get_session_path(token_id)
-        has_session = os.path.exists(session_path)
+        has_session = self.has_session(token_id)
         
-        last_modified = None
+        mtime = None
         if has_session:
             try:
                 mtime = os.path.getmtime(session_path)
-                last_modified = datetime.fromtimestamp(mtime).isoformat()
             except:
                 pass
         
+        status = self._build_status(token_id, has_session, mtime)
+        self._status_cache.set(token_id, status)
+        return dict(status)
+    
+    def _build_status(self, token_id: int, has_session: bool, mtime: Optional[float]) -> Dict:
+        """Build the status dict returned by get_session_status / list_all_sessions."""
         return {
             "has_session": has_session,
-            "session_file": session_path,
+            "session_file": self.get_session_path(token_id),
             "needs_login": not has_session,
-            "last_modified": last_modified,
+            "last_modified": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(mtime)) if mtime is not None else None,
             "message": "已登录" if has_session else "需要浏览器登录"
         }
     
@@ -65,11 +107,72 @@ class SessionManager:
         Returns:
             Dict mapping token_id to session status.
         """
-        return {tid: self.get_session_status(tid) for tid in token_ids}
+        mtimes = self._scan_mtimes()
+        return {
+            tid: self._build_status(tid, tid in mtimes, mtimes.get(tid))
+            for tid in token_ids
+        }
+    
+    def _scan_mtimes(self) -> Dict[int, float]:
+        """Map token ID -> session file mtime with one directory scan (stat comes with the entries)."""
+        mtimes: Dict[int, float] = {}
+        try:
+            with os.scandir(self.SESSION_DIR) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if name.startswith("auth_") and name.endswith(".json") and name[5:-5].isdigit():
+                        try:
+                            mtimes[int(name[5:-5])] = entry.stat().st_mtime
+                        except OSError:
+                            pass
+        except FileNotFoundError:
+            pass
+        return mtimes
     
     def delete_session(self, token_id: int) -> bool:
         """Delete a session file for a token."""
-        session_path = self.get_session_path(token_id)
+        self._forget(token_id)
+        return self._remove_file(token_id, self.get_session_path(token_id))
+    
+    async def delete_session_async(self, token_id: int) -> bool:
+        """delete_session with the unlink run in a worker thread."""
+        return (await self.delete_sessions([token_id]))[token_id]
+    
+    async def delete_sessions(self, token_ids: List[int]) -> Dict[int, bool]:
+        """Delete several session files with a single worker-thread hop."""
+        paths = {}
+        for tid in token_ids:
+            self._forget(tid)
+            paths[tid] = self.get_session_path(tid)
+        return await asyncio.to_thread(
+            lambda: {tid: self._remove_file(tid, path) for tid, path in paths.items()}
+        )
+    
+    async def list_all_sessions_async(self, token_ids: List[int]) -> Dict[int, Dict]:
+        """list_all_sessions with the directory scan run in a worker thread.
+
+        The scan result is also applied to the presence set here on the event loop, picking up
+        session files added or removed outside this process.
+        """
+        started = time.monotonic()
+        mtimes = await asyncio.to_thread(self._scan_mtimes)
+        changed = {tid for tid, at in self._changed_at.items() if at >= started}
+        self._present = {tid for tid in mtimes if tid not in changed} | (self._present & changed)
+        return {
+            tid: self._build_status(tid, tid in self._present, mtimes.get(tid))
+            for tid in token_ids
+        }
+    
+    def _forget(self, token_id: int):
+        """Drop in-memory state for a token's session (runs on the event loop)."""
+        self._present.discard(token_id)
+        self._changed_at[token_id] = time.monotonic()
+        self.invalidate(token_id)
+        forget_storage_state(self.get_session_path(token_id))
+    
+    @staticmethod
+    def _remove_file(token_id: int, session_path: str) -> bool:
+        """Blocking part of session deletion."""
         if os.path.exists(session_path):
             try:
                 os.remove(session_path)
@@ -81,13 +184,10 @@ class SessionManager:
         return True  # Already doesn't exist
 
 
-# Singleton instance
-_session_manager: Optional[SessionManager] = None
+# Created at import: __init__ only ensures the directory exists and scans it once
+session_manager = SessionManager()
 
 
 def get_session_manager() -> SessionManager:
-    """Get the singleton SessionManager instance."""
-    global _session_manager
-    if _session_manager is None:
-        _session_manager = SessionManager()
-    return _session_manager
+    """Get the singleton SessionManager instance (kept for existing callers)."""
+    return session_manager
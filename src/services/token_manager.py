@@ -5,9 +5,14 @@ from typing import Optional, List
 from ..core.database import Database
 from ..core.models import Token, Project
 from ..core.logger import debug_logger
+from ..core.ttl_cache import TTLCache
+from ..core.time_utils import parse_at_expires
 from .flow_client import FlowClient
 from .proxy_manager import ProxyManager
 
+# 429禁用后自动解禁的等待时间
+AUTO_UNBAN_AFTER_SECONDS = 12 * 3600
+
 
 class TokenManager:
     """Token lifecycle manager with AT auto-refresh"""
@@ -16,6 +21,24 @@ class TokenManager:
         self.db = db
         self.flow_client = flow_client
         self._lock = asyncio.Lock()
+        # Bumped on every token mutation, used as cache key by readers
+        self._tokens_gen: int = 0
+        # Short-lived token lookups for admin endpoints (cleared on every mutation)
+        self._token_cache = TTLCache(ttl=30)
+        # Set when a token gets 429-banned so the unban scheduler can recompute its wake-up
+        self._unban_wake = asyncio.Event()
+        # Set when a token is added / edited so the ST refresh scheduler rebuilds its expiry heap
+        self._expiry_wake = asyncio.Event()
+
+    @property
+    def tokens_gen(self) -> int:
+        """Current token generation counter"""
+        return self._tokens_gen
+
+    def mark_tokens_changed(self):
+        """Bump generation counter after token state was modified"""
+        self._tokens_gen += 1
+        self._token_cache.clear()
 
     # ========== Token CRUD ==========
 
@@ -31,9 +54,19 @@ class TokenManager:
         """Get token by ID"""
         return await self.db.get_token(token_id)
 
+    async def get_token_cached(self, token_id: int) -> Optional[Token]:
+        """Get token by ID, served from a 30s cache (use where slight staleness is fine)"""
+        token = self._token_cache.get(token_id)
+        if token is None:
+            token = await self.db.get_token(token_id)
+            if token is not None:
+                self._token_cache.set(token_id, token)
+        return token
+
     async def delete_token(self, token_id: int):
         """Delete token"""
         await self.db.delete_token(token_id)
+        self.mark_tokens_changed()
 
     async def enable_token(self, token_id: int):
         """Enable a token and reset error count"""
@@ -41,10 +74,27 @@ class TokenManager:
         await self.db.update_token(token_id, is_active=True)
         # Reset error count when enabling (only reset total error_count, keep today_error_count)
         await self.db.reset_error_count(token_id)
+        self.mark_tokens_changed()
 
     async def disable_token(self, token_id: int):
         """Disable a token"""
         await self.db.update_token(token_id, is_active=False)
+        self.mark_tokens_changed()
+
+    async def enable_tokens(self, token_ids: List[int]):
+        """Enable many tokens and reset their consecutive error counts"""
+        await self.db.set_tokens_active(token_ids, True)
+        self.mark_tokens_changed()
+
+    async def disable_tokens(self, token_ids: List[int]):
+        """Disable many tokens"""
+        await self.db.set_tokens_active(token_ids, False)
+        self.mark_tokens_changed()
+
+    async def delete_tokens(self, token_ids: List[int]):
+        """Delete many tokens"""
+        await self.db.delete_tokens(token_ids)
+        self.mark_tokens_changed()
 
     # ========== Token添加 (支持Project创建) ==========
 
@@ -90,12 +140,7 @@ class TokenManager:
             name = user_info.get("name", email.split("@")[0] if email else "")
 
             # 解析过期时间
-            at_expires = None
-            if expires:
-                try:
-                    at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                except:
-                    pass
+            at_expires = parse_at_expires(expires)
 
         except Exception as e:
             raise ValueError(f"ST转AT失败: {str(e)}")
@@ -161,6 +206,8 @@ class TokenManager:
             tool_name="PINHOLE"
         )
         await self.db.add_project(project)
+        self.mark_tokens_changed()
+        self._expiry_wake.set()
 
         debug_logger.log_info(f"[ADD_TOKEN] Token added successfully (ID: {token_id}, Email: {email})")
         return token
@@ -227,6 +274,8 @@ class TokenManager:
 
         if update_fields:
             await self.db.update_token(token_id, **update_fields)
+            self.mark_tokens_changed()
+            self._expiry_wake.set()
 
     # ========== AT自动刷新逻辑 (核心) ==========
 
@@ -288,12 +337,7 @@ class TokenManager:
                 expires = result.get("expires")
 
                 # 解析过期时间
-                new_at_expires = None
-                if expires:
-                    try:
-                        new_at_expires = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                    except:
-                        pass
+                new_at_expires = parse_at_expires(expires)
 
                 # 更新数据库
                 await self.db.update_token(
@@ -301,6 +345,7 @@ class TokenManager:
                     at=new_at,
                     at_expires=new_at_expires
                 )
+                self.mark_tokens_changed()
 
                 debug_logger.log_info(f"[AT_REFRESH] Token {token_id}: AT刷新成功")
                 debug_logger.log_info(f"  - 新过期时间: {new_at_expires}")
@@ -351,6 +396,7 @@ class TokenManager:
                 current_project_id=project_id,
                 current_project_name=project_name
             )
+            self.mark_tokens_changed()
 
             # 保存Project到数据库
             project = Project(
@@ -412,17 +458,40 @@ class TokenManager:
             ban_reason="429_rate_limit",
             banned_at=datetime.now(timezone.utc)
         )
+        self.mark_tokens_changed()
+        self._unban_wake.set()
+
+    async def wait_for_unban_wake(self, timeout: float):
+        """Sleep up to timeout seconds, returning early when a new 429 ban is recorded"""
+        await self._wait_event(self._unban_wake, timeout)
+
+    async def wait_for_expiry_wake(self, timeout: float):
+        """Sleep up to timeout seconds, returning early when a token was added or edited"""
+        await self._wait_event(self._expiry_wake, timeout)
+
+    @staticmethod
+    async def _wait_event(event: asyncio.Event, timeout: float):
+        """Wait for event (or timeout), then re-arm it"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
 
-    async def auto_unban_429_tokens(self):
+    async def auto_unban_429_tokens(self) -> Optional[datetime]:
         """自动解禁因429被禁用的token
 
         规则:
         - 距离禁用时间12小时后自动解禁
         - 仅解禁未过期的token
         - 仅解禁因429被禁用的token
+
+        Returns:
+            下一个待解禁token的解禁时间 (没有则为None)
         """
         all_tokens = await self.db.get_all_tokens()
         now = datetime.now(timezone.utc)
+        next_unban = None
 
         for token in all_tokens:
             # 跳过非429禁用的token
@@ -458,7 +527,11 @@ class TokenManager:
 
             # 检查是否已过12小时
             time_since_ban = now - banned_at_aware
-            if time_since_ban.total_seconds() >= 12 * 3600:  # 12小时
+            if time_since_ban.total_seconds() < AUTO_UNBAN_AFTER_SECONDS:
+                unban_at = banned_at_aware + timedelta(seconds=AUTO_UNBAN_AFTER_SECONDS)
+                if next_unban is None or unban_at < next_unban:
+                    next_unban = unban_at
+            else:
                 debug_logger.log_info(
                     f"[AUTO_UNBAN] 解禁Token {token.id} (禁用时间: {banned_at_aware}, "
                     f"已过 {time_since_ban.total_seconds() / 3600:.1f} 小时)"
@@ -471,6 +544,9 @@ class TokenManager:
                 )
                 # 重置错误计数
                 await self.db.reset_error_count(token.id)
+                self.mark_tokens_changed()
+
+        return next_unban
 
     # ========== 余额刷新 ==========
 
@@ -497,6 +573,7 @@ class TokenManager:
 
             # 更新数据库
             await self.db.update_token(token_id, credits=credits)
+            self.mark_tokens_changed()
 
             return credits
         except Exception as e: